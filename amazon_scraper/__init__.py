@@ -0,0 +1,59 @@
+"""Selenium Amazon scraper engine.
+
+Submodules are imported on first attribute access, so ``import amazon_scraper``
+costs next to nothing and Selenium, urllib3 and the storage backends are only
+loaded by the code paths that use them.
+"""
+import importlib
+
+_EXPORTS = {
+    "config": None,
+    "ProductData": "models",
+    "ProductPageData": "models",
+    "record_key": "models",
+    "DataPipeline": "pipeline",
+    "submit_bounded": "pipeline",
+    "create_driver": "scraper",
+    "search_products": "scraper",
+    "threaded_search": "scraper",
+    "multi_region_search": "scraper",
+    "staged_search": "scraper",
+    "parse_search_page": "parsers",
+    "extract_asin": "urls",
+    "canonical_url": "urls",
+    "unique_lookups": "urls",
+    "parse_product": "scraper",
+    "threaded_item_lookup": "scraper",
+    "crawl": "scraper",
+    "CrawlEngine": "scraper",
+    "LookupBudget": "priority",
+    "prioritized": "priority",
+    "DriverPool": "drivers",
+    "DriverWatchdog": "drivers",
+    "ImageDownloader": "images",
+    "PageArchive": "archive",
+    "ArchiveReader": "archive",
+    "PriceHistoryStore": "price_history",
+    "ContentHashIndex": "change_index",
+    "AsinIndex": "asin_index",
+    "WriteAheadLog": "wal",
+    "JobQueue": "daemon",
+    "serve_api": "server",
+    "tracer": "tracing",
+    "failure_recorder": "diagnostics",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name = _EXPORTS[name]
+    if module_name is None:
+        return importlib.import_module(f".{name}", __name__)
+    return getattr(importlib.import_module(f".{module_name}", __name__), name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
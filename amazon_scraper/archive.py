@@ -0,0 +1,203 @@
+"""Append-only WARC archive of fetched pages with an offset index.
+
+Pages are written as WARC/1.1 ``resource`` records into segment files
+(``pages-00001.warc``, ...) that roll over at ``segment_bytes``. Every record
+also gets a line in ``index.tsv``:
+
+    timestamp<TAB>kind<TAB>location<TAB>segment<TAB>record_offset<TAB>payload_offset<TAB>payload_length<TAB>url
+
+Readers map the segments with ``mmap`` and return payloads as memoryview
+slices, so looking up or reparsing a page never copies the segment.
+Records are stored uncompressed to keep them sliceable.
+"""
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from collections import namedtuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ArchiveEntry = namedtuple(
+    "ArchiveEntry",
+    ["timestamp", "kind", "location", "segment", "record_offset", "payload_offset", "payload_length", "url"],
+)
+
+SEGMENT_NAME = re.compile(r"^pages-(\d{5})\.warc$")
+INDEX_NAME = "index.tsv"
+
+
+def segment_name(number):
+    return f"pages-{number:05d}.warc"
+
+
+def warc_headers(url, kind, location, timestamp, length):
+    headers = [
+        "WARC/1.1",
+        "WARC-Type: resource",
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+        f"WARC-Date: {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))}",
+        f"WARC-Target-URI: {url}",
+        "Content-Type: text/html; charset=utf-8",
+        f"WARC-Scraper-Kind: {kind}",
+        f"WARC-Scraper-Location: {location}",
+        f"Content-Length: {length}",
+    ]
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("utf-8")
+
+
+class PageArchive:
+    """Writes fetched pages into WARC segments; safe to share between threads."""
+
+    def __init__(self, directory="archive", segment_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        numbers = [
+            int(match.group(1))
+            for match in map(SEGMENT_NAME.match, os.listdir(directory))
+            if match
+        ]
+        self.segment_number = max(numbers, default=1)
+        self.segment_file = self.open_segment()
+        self.index_file = open(os.path.join(directory, INDEX_NAME), "a", encoding="utf-8")
+
+    def open_segment(self):
+        return open(os.path.join(self.directory, segment_name(self.segment_number)), "ab")
+
+    def write(self, url, html, kind="search", location="us", timestamp=None):
+        """Append one page and index it; returns its ArchiveEntry."""
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        payload = html.encode("utf-8") if isinstance(html, str) else html
+        header = warc_headers(url, kind, location, timestamp, len(payload))
+
+        with self.lock:
+            if self.segment_file.tell() >= self.segment_bytes:
+                self.segment_file.close()
+                self.segment_number += 1
+                self.segment_file = self.open_segment()
+            record_offset = self.segment_file.tell()
+            self.segment_file.write(header)
+            self.segment_file.write(payload)
+            self.segment_file.write(b"\r\n\r\n")
+            entry = ArchiveEntry(
+                timestamp, kind, location, segment_name(self.segment_number),
+                record_offset, record_offset + len(header), len(payload), url,
+            )
+            self.index_file.write("\t".join(str(value) for value in entry) + "\n")
+        metrics.inc("archived_pages_total", kind=kind)
+        metrics.inc("archived_bytes_total", len(header) + len(payload))
+        return entry
+
+    def flush(self):
+        """Make written records visible to readers."""
+        with self.lock:
+            self.segment_file.flush()
+            self.index_file.flush()
+
+    def close(self):
+        with self.lock:
+            self.segment_file.close()
+            self.index_file.close()
+
+
+class ArchiveReader:
+    """Random access to a PageArchive directory through memory-mapped segments."""
+
+    def __init__(self, directory="archive", load_index=True):
+        self.directory = directory
+        self.entries = {}
+        self.maps = {}
+        self.lock = threading.Lock()
+        if load_index:
+            self.load_index()
+
+    def load_index(self):
+        path = os.path.join(self.directory, INDEX_NAME)
+        if not os.path.isfile(path):
+            return
+        with open(path, encoding="utf-8") as index_file:
+            for line_number, line in enumerate(index_file, start=1):
+                if not line.endswith("\n"):
+                    logger.warning(f"Ignoring truncated line {line_number} in {path}")
+                    break
+                parts = line.rstrip("\n").split("\t", 7)
+                try:
+                    entry = ArchiveEntry(
+                        int(parts[0]), parts[1], parts[2], parts[3],
+                        int(parts[4]), int(parts[5]), int(parts[6]), parts[7],
+                    )
+                except (ValueError, IndexError) as e:
+                    logger.warning(f"Ignoring bad line {line_number} in {path}: {e}")
+                    continue
+                self.entries.setdefault((entry.url, entry.location), []).append(entry)
+        for versions in self.entries.values():
+            versions.sort()
+
+    def __iter__(self):
+        for versions in self.entries.values():
+            yield from versions
+
+    def __len__(self):
+        return sum(len(versions) for versions in self.entries.values())
+
+    def segment_map(self, segment, size=0):
+        with self.lock:
+            segment_map = self.maps.get(segment)
+            # The live segment may have grown since it was mapped
+            if segment_map is None or len(segment_map) < size:
+                with open(os.path.join(self.directory, segment), "rb") as segment_file:
+                    segment_map = self.maps[segment] = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            return segment_map
+
+    def payload(self, entry):
+        """The page bytes of ``entry`` as a memoryview into the mapped segment."""
+        start = entry.payload_offset
+        end = start + entry.payload_length
+        return memoryview(self.segment_map(entry.segment, end))[start:end]
+
+    def find(self, url, location="us", at=None):
+        """The newest entry for ``url`` in ``location`` at or before ``at``, or None."""
+        versions = self.entries.get((url, location))
+        if not versions:
+            return None
+        if at is None:
+            return versions[-1]
+        index = bisect_right(versions, at, key=lambda entry: entry.timestamp)
+        return versions[index - 1] if index else None
+
+    def get(self, url, location="us", at=None):
+        entry = self.find(url, location, at)
+        return None if entry is None else self.payload(entry)
+
+    def close(self):
+        with self.lock:
+            maps, self.maps = self.maps, {}
+        for segment_map in maps.values():
+            try:
+                segment_map.close()
+            except BufferError:
+                # A caller still holds a payload view; the map is freed with it
+                pass
+
+
+# Per-process segment maps for reparse workers
+_worker_readers = {}
+
+
+def parse_archived_search_page(directory, entry):
+    """Process-pool entry point: parse one archived search page into ProductData records."""
+    from .parsers import parse_search_page
+
+    reader = _worker_readers.get(directory)
+    if reader is None:
+        reader = _worker_readers[directory] = ArchiveReader(directory, load_index=False)
+    return parse_search_page(str(reader.payload(entry), "utf-8"), entry.location)
@@ -0,0 +1,146 @@
+"""Persistent index of every product key seen or scraped, shared across keywords and runs.
+
+Keys are ``record_key`` strings (``location:ASIN``). Each row records when
+the product was first and last seen in search results and when its product
+page was last scraped. Lookups go through an in-process LRU, so repeated
+checks never touch SQLite; writes are batched and committed together.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import metrics
+from .urls import lookup_key
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS asins (
+    key TEXT PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_scraped REAL
+) WITHOUT ROWID
+"""
+UPSERT = """
+INSERT INTO asins (key, first_seen, last_seen, last_scraped) VALUES (?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET last_seen = excluded.last_seen, last_scraped = excluded.last_scraped
+"""
+
+FIRST_SEEN, LAST_SEEN, LAST_SCRAPED = range(3)
+
+
+class AsinIndex:
+    """SQLite-backed key index with an LRU cache in front.
+
+    "This run" means since the index was opened (or since ``run_started``
+    when one is given): ``mark_seen`` reports a key
+    as new once per run, which lets pipelines for different keywords drop
+    each other's products.
+    """
+
+    def __init__(self, path="asins.sqlite", cache_size=100000, flush_every=512, run_started=None):
+        self.path = path
+        self.cache_size = cache_size
+        self.flush_every = flush_every
+        # A resumed crawl passes the interrupted run's start, so it continues that run
+        self.run_started = time.time() if run_started is None else run_started
+        self.cache = OrderedDict()
+        self.dirty = {}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+    def load(self, key):
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.cache.move_to_end(key)
+            return entry
+        entry = self.dirty.get(key)
+        if entry is None:
+            row = self.connection.execute(
+                "SELECT first_seen, last_seen, last_scraped FROM asins WHERE key = ?", (key,)
+            ).fetchone()
+            metrics.inc("asin_index_misses_total")
+            if row is None:
+                return None
+            entry = list(row)
+        self.cache[key] = entry
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return entry
+
+    def store(self, key, entry):
+        self.cache[key] = entry
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        self.dirty[key] = entry
+        if len(self.dirty) >= self.flush_every:
+            self.write_dirty()
+
+    def write_dirty(self):
+        if not self.dirty:
+            return
+        rows = [(key, *entry) for key, entry in self.dirty.items()]
+        self.dirty = {}
+        with self.connection:
+            self.connection.executemany(UPSERT, rows)
+
+    def get(self, key):
+        """``(first_seen, last_seen, last_scraped)`` for ``key``, or None if it was never seen."""
+        with self.lock:
+            entry = self.load(key)
+            return tuple(entry) if entry is not None else None
+
+    def mark_seen(self, key, timestamp=None):
+        """Record a sighting; returns True the first time ``key`` is seen in this run."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            entry = self.load(key)
+            if entry is None:
+                self.store(key, [timestamp, timestamp, None])
+                return True
+            is_new = entry[LAST_SEEN] < self.run_started
+            self.store(key, [entry[FIRST_SEEN], max(entry[LAST_SEEN], timestamp), entry[LAST_SCRAPED]])
+            return is_new
+
+    def mark_scraped(self, key, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            entry = self.load(key) or [timestamp, timestamp, None]
+            self.store(key, [entry[FIRST_SEEN], entry[LAST_SEEN], timestamp])
+
+    def needs_scrape(self, key, max_age=None):
+        """False if ``key`` was scraped in this run, or within ``max_age`` seconds when given."""
+        with self.lock:
+            entry = self.load(key)
+        if entry is None or entry[LAST_SCRAPED] is None:
+            return True
+        if max_age is None:
+            return entry[LAST_SCRAPED] < self.run_started
+        return time.time() - entry[LAST_SCRAPED] >= max_age
+
+    def flush(self):
+        with self.lock:
+            self.write_dirty()
+
+    def close(self):
+        with self.lock:
+            self.write_dirty()
+            self.connection.close()
+
+
+def unscraped_lookups(rows, asin_index, location="us", max_age=None):
+    """Yield the rows whose product page ``asin_index`` does not consider fresh."""
+    for row in rows:
+        row_location, asin = lookup_key(row, location)
+        if not asin_index.needs_scrape(f"{row_location}:{asin}", max_age):
+            metrics.inc("products_skipped_total", reason="scraped")
+            continue
+        yield row
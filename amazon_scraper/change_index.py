@@ -0,0 +1,62 @@
+"""Content-hash index used to emit only records that changed since the last run.
+
+The index maps each record key (the ASIN) to a digest of the record's
+fields and is persisted as ``key<TAB>digest`` lines between runs.
+"""
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import fields
+
+logger = logging.getLogger(__name__)
+
+# The search result URL embeds a per-request qid and rank, so it changes on
+# every run without the product changing
+DEFAULT_EXCLUDE = ("url",)
+
+
+class ContentHashIndex:
+
+    def __init__(self, path, exclude=DEFAULT_EXCLUDE):
+        self.path = path
+        self.exclude = set(exclude)
+        self.hashes = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, encoding="utf-8") as index_file:
+            for line in index_file:
+                key, _, digest = line.rstrip("\n").partition("\t")
+                if digest:
+                    self.hashes[key] = digest
+        logger.info(f"Loaded {len(self.hashes)} content hashes from {self.path}")
+
+    def digest(self, record):
+        values = tuple(
+            getattr(record, field.name)
+            for field in fields(record)
+            if field.name not in self.exclude
+        )
+        return hashlib.blake2b(repr(values).encode("utf-8"), digest_size=16).hexdigest()
+
+    def has_changed(self, record, key=None):
+        """Return True, and remember the new digest, if ``record`` differs from its stored version."""
+        key = record.name if key is None else key
+        digest = self.digest(record)
+        with self.lock:
+            if self.hashes.get(key) == digest:
+                return False
+            self.hashes[key] = digest
+            return True
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as index_file:
+                for key, digest in self.hashes.items():
+                    index_file.write(f"{key}\t{digest}\n")
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,323 @@
+"""Command line entry point: ``python -m amazon_scraper <command> ...``.
+
+Only argparse is imported up front; each command imports the parts of the
+engine it needs, so ``--help`` and the browser-free commands start in
+milliseconds.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+
+def add_crawl_arguments(parser):
+    parser.add_argument("--threads", type=int, default=3, help="concurrent browsers per location")
+    parser.add_argument("--parse-workers", type=int, default=0, help="parse search pages in this many processes instead of in the browser threads")
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--location", dest="locations", action="append", help="marketplace country code, repeatable (default: us)")
+    parser.add_argument("--images", metavar="DIR", help="download product images into DIR")
+    parser.add_argument("--archive", metavar="DIR", help="keep every fetched page in a WARC archive in DIR")
+    parser.add_argument("--priority", help="look products up best first by rank, organic, price, discount or module:function (default: file order, streamed)")
+    parser.add_argument("--budget-seconds", type=float, help="stop product lookups after this many seconds")
+    parser.add_argument("--budget-credits", type=int, help="stop product lookups after this many proxy requests")
+    parser.add_argument("--change-only", action="store_true", help="only write records that changed since the last run")
+    parser.add_argument("--reuse-drivers", action=argparse.BooleanOptionalAction, default=None, help="keep browsers warm between pages (default: on in proxy-port mode)")
+    parser.add_argument("--driver-max-pages", type=int, default=200, help="recycle a warm browser after this many pages, 0 for never (default: 200)")
+    parser.add_argument("--driver-max-mb", type=int, default=1500, help="recycle a warm browser whose processes use more memory than this, 0 for never (default: 1500)")
+    parser.add_argument("--price-history", default="price_history.log", metavar="FILE")
+    parser.add_argument("--asin-index", default="asins.sqlite", metavar="FILE", help="products seen and scraped across keywords and runs ('' to disable)")
+    parser.add_argument("--rescrape-after", type=float, metavar="SECONDS", help="skip products scraped by earlier runs within this many seconds (default: only skip those scraped in this run)")
+    parser.add_argument("--rotate-rows", type=int, help="start a new search output shard after this many rows")
+    parser.add_argument("--rotate-mb", type=float, help="start a new search output shard after this many megabytes")
+    parser.add_argument("--rotate-seconds", type=float, help="start a new search output shard after this many seconds")
+    parser.add_argument("--durable", action="store_true", help="log search results to a write-ahead log so a crash loses none of them")
+    parser.add_argument("--commit-window-ms", type=float, default=2, help="how long a write-ahead log fsync waits for other threads to join it (default: 2)")
+    parser.add_argument("--drain-seconds", type=float, default=30, help="on SIGTERM/SIGINT, how long in-flight pages get to finish (default: 30)")
+    parser.add_argument("--checkpoint", default="crawl.checkpoint.json", metavar="FILE", help="where an interrupted crawl saves what is left for 'resume'")
+    parser.add_argument("--metrics-file", default="metrics.prom", metavar="FILE")
+    parser.add_argument("--metrics-interval", type=float, default=30)
+    parser.add_argument("--trace-file", default="spans.jsonl", metavar="FILE")
+    parser.add_argument("--failure-dir", default="failures", metavar="DIR")
+    parser.add_argument("--failure-max-mb", type=int, default=200)
+    parser.add_argument("--no-screenshots", dest="screenshots", action="store_false")
+
+
+def crawl_options(args):
+    return {
+        "max_threads": args.threads,
+        "retries": args.retries,
+        "locations": args.locations or ["us"],
+        "image_dir": args.images,
+        "change_only": args.change_only,
+        "reuse_drivers": args.reuse_drivers,
+        "driver_max_pages": args.driver_max_pages,
+        "driver_max_rss_mb": args.driver_max_mb,
+        "parse_workers": args.parse_workers,
+        "archive_dir": args.archive,
+        "priority": args.priority,
+        "budget_seconds": args.budget_seconds,
+        "budget_credits": args.budget_credits,
+        "price_history_file": args.price_history,
+        "asin_index_file": args.asin_index,
+        "rescrape_after": args.rescrape_after,
+        "rotate_rows": args.rotate_rows,
+        "rotate_bytes": int(args.rotate_mb * 1024 * 1024) if args.rotate_mb else None,
+        "rotate_seconds": args.rotate_seconds,
+        "durable": args.durable,
+        "commit_window": args.commit_window_ms / 1000,
+        "metrics_file": args.metrics_file,
+        "metrics_interval": args.metrics_interval,
+        "trace_file": args.trace_file,
+        "failure_dir": args.failure_dir,
+        "failure_max_mb": args.failure_max_mb,
+        "failure_screenshots": args.screenshots,
+        "drain_seconds": args.drain_seconds,
+        "checkpoint_file": args.checkpoint,
+    }
+
+
+def search_command(args):
+    from .scraper import crawl
+
+    crawl(args.keywords, pages=args.pages, details=args.details, **crawl_options(args))
+
+
+def lookup_command(args):
+    from .scraper import crawl
+
+    crawl([], csv_files=args.csv_files, **crawl_options(args))
+
+
+def resume_command(args):
+    from .scraper import crawl
+    from .shutdown import read_checkpoint
+
+    try:
+        checkpoint = read_checkpoint(args.checkpoint)
+    except FileNotFoundError:
+        sys.exit(f"No checkpoint at {args.checkpoint}, nothing to resume")
+    crawl(
+        checkpoint["products"],
+        pages=checkpoint["pages"],
+        details=checkpoint["details"],
+        csv_files=checkpoint["csv_files"],
+        run_started=checkpoint["run_started"],
+        **crawl_options(args)
+    )
+
+
+def daemon_command(args):
+    from .daemon import JobQueue, serve
+    from .scraper import CrawlEngine
+
+    options = crawl_options(args)
+    drain_seconds = options.pop("drain_seconds")
+    options.pop("checkpoint_file")
+    # Warm drivers are the point of the daemon
+    if options["reuse_drivers"] is None:
+        options["reuse_drivers"] = True
+    serve(CrawlEngine(**options), JobQueue(args.queue), poll_interval=args.poll_interval, drain_seconds=drain_seconds, once=args.once)
+
+
+def serve_command(args):
+    from .scraper import CrawlEngine
+    from .server import serve_api
+
+    options = crawl_options(args)
+    drain_seconds = options.pop("drain_seconds")
+    options.pop("checkpoint_file")
+    if options["reuse_drivers"] is None:
+        options["reuse_drivers"] = True
+    serve_api(CrawlEngine(**options), host=args.host, port=args.port, cache_ttl=args.cache_ttl, drain_seconds=drain_seconds)
+
+
+def submit_command(args):
+    from .daemon import JobQueue
+
+    job = {
+        "keywords": args.keywords,
+        "pages": args.pages,
+        "details": args.details,
+        "asins": args.asins or [],
+        "locations": args.locations or [],
+    }
+    if not job["keywords"] and not job["asins"]:
+        sys.exit("Nothing to do: give keywords or --asin")
+    queue = JobQueue(args.queue)
+    try:
+        print(queue.submit(job))
+    finally:
+        queue.close()
+
+
+def jobs_command(args):
+    from .daemon import JobQueue
+
+    queue = JobQueue(args.queue)
+    try:
+        jobs = queue.jobs(status=args.status, limit=args.limit)
+    finally:
+        queue.close()
+    for job_id, status, job, submitted, started, finished, error in jobs:
+        submitted_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(submitted))
+        took = f"{finished - started:.1f}s" if started and finished else ""
+        print(f"{job_id}\t{status}\t{submitted_at}\t{took}\t{json.dumps(job)}\t{error or ''}")
+
+
+def parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, "%Y-%m-%d"))
+
+
+def history_command(args):
+    from .price_history import PriceHistoryStore
+
+    # History is keyed by location:ASIN; a bare ASIN gets --location
+    key = args.asin
+    if key and ":" not in key:
+        key = f"{args.location}:{key.upper()}"
+    store = PriceHistoryStore(args.price_history)
+    try:
+        if args.at is not None:
+            point = store.price_at(key, parse_time(args.at))
+            changes = [(key, point)] if point else []
+        else:
+            changes = store.changes_since(parse_time(args.since), asin=key)
+    finally:
+        store.close()
+    for asin, point in changes:
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(point.timestamp))}\t{asin}\t{point.price}\t{point.real_price}\t{point.rating}")
+
+
+def compact_history_command(args):
+    from .price_history import PriceHistoryStore
+
+    store = PriceHistoryStore(args.price_history)
+    try:
+        store.compact(before=parse_time(args.before) if args.before else None)
+    finally:
+        store.close()
+
+
+def archive_get_command(args):
+    from .archive import ArchiveReader
+
+    reader = ArchiveReader(args.archive)
+    payload = reader.get(args.url, args.location, parse_time(args.at) if args.at else None)
+    if payload is None:
+        sys.exit(f"{args.url} ({args.location}) is not in {args.archive}")
+    sys.stdout.buffer.write(payload)
+    sys.stdout.flush()
+    payload.release()
+    reader.close()
+
+
+def archive_reparse_command(args):
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    from .archive import ArchiveReader, parse_archived_search_page
+    from .pipeline import DataPipeline
+
+    reader = ArchiveReader(args.archive)
+    entries = [entry for entry in reader if entry.kind == "search"]
+    pipeline = DataPipeline(csv_filename=args.output)
+    with ProcessPoolExecutor(max_workers=args.parse_workers or None) as parsers:
+        for products in parsers.map(partial(parse_archived_search_page, args.archive), entries, chunksize=16):
+            pipeline.add_many(products)
+    pipeline.close_pipeline()
+    logging.getLogger(__name__).info(f"Reparsed {len(entries)} archived search pages into {args.output}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="amazon_scraper", description="Scrape Amazon search results and product pages through ScrapeOps.")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search = commands.add_parser("search", help="search keywords, then scrape every result's product page")
+    search.add_argument("keywords", nargs="+")
+    search.add_argument("--pages", type=int, default=3)
+    search.add_argument("--no-details", dest="details", action="store_false", help="skip the product page lookups")
+    add_crawl_arguments(search)
+    search.set_defaults(handler=search_command)
+
+    lookup = commands.add_parser("lookup", help="scrape the product pages listed in earlier search CSVs")
+    lookup.add_argument("csv_files", nargs="+")
+    add_crawl_arguments(lookup)
+    lookup.set_defaults(handler=lookup_command)
+
+    resume = commands.add_parser("resume", help="finish the keywords and lookups an interrupted crawl left in its checkpoint")
+    add_crawl_arguments(resume)
+    resume.set_defaults(handler=resume_command)
+
+    daemon = commands.add_parser("daemon", help="keep browsers warm and run jobs from a queue until stopped")
+    daemon.add_argument("--queue", default="jobs.sqlite", metavar="FILE")
+    daemon.add_argument("--poll-interval", type=float, default=1.0, help="seconds between checks of an empty queue")
+    daemon.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    add_crawl_arguments(daemon)
+    daemon.set_defaults(handler=daemon_command)
+
+    serve = commands.add_parser("serve", help="answer search and product requests over a local HTTP API")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--cache-ttl", type=float, default=600, help="seconds an answer is served from the cache (default: 600)")
+    add_crawl_arguments(serve)
+    serve.set_defaults(handler=serve_command)
+
+    submit = commands.add_parser("submit", help="queue a job for the daemon and print its id")
+    submit.add_argument("keywords", nargs="*")
+    submit.add_argument("--asin", dest="asins", action="append", help="look up this product directly, repeatable")
+    submit.add_argument("--pages", type=int, default=3)
+    submit.add_argument("--no-details", dest="details", action="store_false", help="skip the product page lookups")
+    submit.add_argument("--location", dest="locations", action="append", help="marketplace country code, repeatable (default: the daemon's)")
+    submit.add_argument("--queue", default="jobs.sqlite", metavar="FILE")
+    submit.set_defaults(handler=submit_command)
+
+    jobs = commands.add_parser("jobs", help="list queued, running and finished jobs")
+    jobs.add_argument("--status", choices=["queued", "running", "done", "failed"])
+    jobs.add_argument("--limit", type=int, default=50)
+    jobs.add_argument("--queue", default="jobs.sqlite", metavar="FILE")
+    jobs.set_defaults(handler=jobs_command)
+
+    history = commands.add_parser("history", help="print recorded price changes")
+    history.add_argument("asin", nargs="?", help="ASIN or location:ASIN")
+    history.add_argument("--location", default="us", help="marketplace of a bare ASIN (default: us)")
+    history.add_argument("--since", default="0", help="epoch seconds or YYYY-MM-DD")
+    history.add_argument("--at", help="print the price in effect at this time instead (needs ASIN)")
+    history.add_argument("--price-history", default="price_history.log", metavar="FILE")
+    history.set_defaults(handler=history_command)
+
+    compact = commands.add_parser("compact-history", help="rewrite the price history log")
+    compact.add_argument("--before", help="fold changes older than this time (epoch seconds or YYYY-MM-DD)")
+    compact.add_argument("--price-history", default="price_history.log", metavar="FILE")
+    compact.set_defaults(handler=compact_history_command)
+
+    archive = commands.add_parser("archive", help="read pages from a WARC archive")
+    archive.add_argument("--archive", default="archive", metavar="DIR")
+    archive_commands = archive.add_subparsers(dest="archive_command", required=True)
+    archive_get = archive_commands.add_parser("get", help="write the archived HTML of URL to stdout")
+    archive_get.add_argument("url")
+    archive_get.add_argument("--location", default="us")
+    archive_get.add_argument("--at", help="newest version at or before this time (epoch seconds or YYYY-MM-DD)")
+    archive_get.set_defaults(handler=archive_get_command)
+    archive_reparse = archive_commands.add_parser("reparse", help="parse every archived search page into a CSV")
+    archive_reparse.add_argument("output")
+    archive_reparse.add_argument("--parse-workers", type=int, default=0, help="parser processes (default: one per core)")
+    archive_reparse.set_defaults(handler=archive_reparse_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "history" and args.at is not None and not args.asin:
+        parser.error("--at needs an ASIN")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,13 @@
+"""ScrapeOps settings shared by every entry point.
+
+Values are read from the environment at import time and can be overridden by
+assigning to the module attributes before a scrape starts.
+"""
+import os
+
+API_KEY = os.environ.get("SCRAPEOPS_API_KEY", "YOUR-SUPER-SECRET-API-KEY")
+PROXY_ENDPOINT = os.environ.get("SCRAPEOPS_PROXY_ENDPOINT", "https://proxy.scrapeops.io/v1/")
+# "api" rewrites every URL through PROXY_ENDPOINT, "port" uses the proxy as an
+# HTTP proxy so pages keep their native URLs and browser session
+PROXY_MODE = os.environ.get("SCRAPEOPS_PROXY_MODE", "api")
+HEADLESS = os.environ.get("SCRAPEOPS_HEADLESS", "1") != "0"
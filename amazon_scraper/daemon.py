@@ -0,0 +1,267 @@
+"""Long-running crawl daemon fed from a SQLite job queue.
+
+``python -m amazon_scraper daemon`` pays the interpreter, Selenium and
+Chrome start-up once, then keeps its ``CrawlEngine`` (warm drivers, parse
+processes, HTTP pools and stores) open while it works through the jobs that
+``python -m amazon_scraper submit`` adds to ``jobs.sqlite``. A job is a JSON
+object::
+
+    {"keywords": ["phone"], "pages": 3, "details": true,
+     "asins": ["B0C7SGVLP1"], "locations": ["us", "uk"]}
+
+Keywords are searched into ``{keyword}.csv`` (and their results looked up
+unless ``details`` is false, into ``{keyword}_products.csv``); ASINs are
+looked up directly in every location, into ``products.csv``.
+
+Several daemons can share one queue file. Each running job records its
+daemon and a heartbeat; a job goes back in the queue only once its daemon
+is gone (a dead process on this host, or no heartbeat for ``stale_after``
+seconds).
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from .metrics import metrics
+from .shutdown import shutdown
+from .urls import canonical_url
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    job TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    owner TEXT,
+    heartbeat REAL
+)
+"""
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """Jobs in a SQLite table; ``claim`` hands each queued job to exactly one daemon.
+
+    ``owner`` identifies this daemon as ``host:pid:nonce``, and
+    ``heartbeat`` keeps its running jobs from being taken for abandoned.
+    """
+
+    def __init__(self, path="jobs.sqlite"):
+        self.path = path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # The heartbeat thread shares the connection
+        self.lock = threading.Lock()
+        # Autocommit, so claim can take the write lock with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        # Queue files created before jobs had owners
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def submit(self, job):
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO jobs (job, submitted) VALUES (?, ?)", (json.dumps(job), time.time())
+            )
+        return cursor.lastrowid
+
+    def claim(self):
+        """Mark the oldest queued job running and return ``(job_id, job)``, or None if there is none."""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    "SELECT id, job FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    self.connection.execute(
+                        "UPDATE jobs SET status = ?, started = ?, owner = ?, heartbeat = ? WHERE id = ?",
+                        (RUNNING, now, self.owner, now, row[0])
+                    )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return (row[0], json.loads(row[1])) if row is not None else None
+
+    def heartbeat(self):
+        """Refresh the heartbeat of every job this daemon is running."""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = ?", (time.time(), self.owner, RUNNING)
+            )
+
+    def finish(self, job_id, error=None):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                (FAILED if error else DONE, time.time(), error, job_id)
+            )
+
+    def requeue(self, job_id):
+        """Put ``job_id`` back in the queue, e.g. after a shutdown interrupted it."""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, started = NULL, owner = NULL, heartbeat = NULL WHERE id = ?", (QUEUED, job_id)
+            )
+
+    def requeue_abandoned(self, stale_after=120):
+        """Requeue running jobs whose daemon is gone; returns how many.
+
+        A daemon is gone if it ran on this host and its process is dead, or
+        if it has not sent a heartbeat for ``stale_after`` seconds.
+        """
+        host = socket.gethostname()
+        now = time.time()
+        with self.lock:
+            running = self.connection.execute(
+                "SELECT id, owner, heartbeat FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+            abandoned = []
+            for job_id, owner, heartbeat in running:
+                owner_host, _, rest = (owner or "").partition(":")
+                pid = rest.partition(":")[0]
+                if owner_host == host and pid.isdigit() and not process_alive(int(pid)):
+                    abandoned.append(job_id)
+                elif heartbeat is None or now - heartbeat > stale_after:
+                    abandoned.append(job_id)
+            requeued = 0
+            for job_id in abandoned:
+                # Only if nobody touched it since we looked
+                requeued += self.connection.execute(
+                    "UPDATE jobs SET status = ?, started = NULL, owner = NULL, heartbeat = NULL WHERE id = ? AND status = ?",
+                    (QUEUED, job_id, RUNNING)
+                ).rowcount
+        return requeued
+
+    def jobs(self, status=None, limit=50):
+        """The newest jobs as ``(id, status, job, submitted, started, finished, error)`` tuples."""
+        query = "SELECT id, status, job, submitted, started, finished, error FROM jobs"
+        parameters = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            parameters = (status,)
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY id DESC LIMIT ?", (*parameters, limit)).fetchall()
+        return [(row[0], row[1], json.loads(row[2]), *row[3:]) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def asin_rows(asins, locations):
+    """Lookup rows for bare ASINs, one per location."""
+    return [
+        {"name": asin.upper(), "url": canonical_url(asin), "location": location}
+        for location in locations
+        for asin in asins
+    ]
+
+
+def run_job(engine, job):
+    """Run one job on ``engine``; returns False if a shutdown interrupted it."""
+    # Each job is a run of its own for the ASIN index, not the daemon's lifetime
+    engine.run_started = time.time()
+    if engine.asin_index is not None:
+        engine.asin_index.run_started = engine.run_started
+    locations = job.get("locations") or engine.locations
+    budget = engine.budget()
+    csv_files = []
+    for keyword in job.get("keywords", ()):
+        if shutdown.stopping:
+            return False
+        csv_files.append(engine.search(keyword, job.get("pages", 3), locations))
+    if job.get("details", True):
+        for csv_filename in csv_files:
+            if shutdown.stopping:
+                return False
+            engine.lookup(csv_filename, budget=budget)
+    if job.get("asins") and not shutdown.stopping:
+        engine.lookup_rows(asin_rows(job["asins"], locations), budget=budget)
+    return not shutdown.stopping
+
+
+def serve(engine, queue, poll_interval=1.0, drain_seconds=30, once=False, heartbeat_interval=10, stale_after=120):
+    """Run queued jobs on ``engine`` until SIGTERM/SIGINT (or, with ``once``, until the queue is empty).
+
+    A job interrupted by the shutdown, or abandoned by a daemon that died,
+    goes back in the queue and is picked up again from the start.
+    ``stale_after`` should be well above ``heartbeat_interval``.
+    """
+    from .scraper import DRIVER_WATCHDOG
+
+    shutdown.install(drain_seconds)
+    shutdown.at_deadline(DRIVER_WATCHDOG.kill_all)
+    stopped = threading.Event()
+
+    def send_heartbeats():
+        while not stopped.wait(heartbeat_interval):
+            try:
+                queue.heartbeat()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to send job heartbeat: {e}")
+
+    heartbeats = threading.Thread(target=send_heartbeats, name="job-heartbeat", daemon=True)
+    heartbeats.start()
+    engine.warm()
+    logger.info(f"Waiting for jobs in {queue.path} as {queue.owner}")
+    try:
+        while not shutdown.stopping:
+            claimed = queue.claim()
+            if claimed is None:
+                requeued = queue.requeue_abandoned(stale_after)
+                if requeued:
+                    logger.warning(f"Requeued {requeued} jobs abandoned by a daemon that is gone")
+                    continue
+                if once:
+                    break
+                shutdown.requested.wait(poll_interval)
+                continue
+            job_id, job = claimed
+            logger.info(f"Starting job {job_id}: {job}")
+            started = time.monotonic()
+            try:
+                finished = run_job(engine, job)
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                queue.finish(job_id, error=str(e))
+                metrics.inc("jobs_total", status=FAILED)
+                continue
+            if not finished:
+                queue.requeue(job_id)
+                break
+            queue.finish(job_id)
+            metrics.inc("jobs_total", status=DONE)
+            metrics.observe("job_seconds", time.monotonic() - started)
+            logger.info(f"Finished job {job_id} in {time.monotonic() - started:.1f}s")
+    finally:
+        stopped.set()
+        heartbeats.join()
+        engine.close()
+        queue.close()
+        shutdown.uninstall()
@@ -0,0 +1,148 @@
+"""Background capture of failed pages for later debugging.
+
+Worker threads only pull ``page_source`` (and optionally a screenshot) from
+the driver; compression and disk writes happen on a background thread. The
+capture directory is a ring buffer: once the captures in it exceed
+``max_bytes`` the oldest are deleted. Other files there are left alone.
+"""
+import base64
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+UNSAFE_CHARACTERS = re.compile(r"[^A-Za-z0-9._-]+")
+# What ``write`` names its files; anything else in the directory is never counted or deleted
+CAPTURE_NAME = re.compile(r"\d{8}T\d{6}-[A-Za-z0-9._-]+-a\d+\.(?:html\.gz|json|png)")
+
+
+def safe_name(value):
+    return UNSAFE_CHARACTERS.sub("_", str(value))[:120]
+
+
+class FailureRecorder:
+
+    def __init__(self, directory="failures", max_bytes=200 * 1024 * 1024, screenshots=True, queue_size=64):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.screenshots = screenshots
+        self.captures = queue.Queue(maxsize=queue_size)
+        self.files = []
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def configure(self, directory=None, max_bytes=None, screenshots=None):
+        if directory is not None:
+            self.directory = directory
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if screenshots is not None:
+            self.screenshots = screenshots
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self.load_existing()
+            self.thread = threading.Thread(target=self.run, name="failure-recorder", daemon=True)
+            self.thread.start()
+
+    def load_existing(self):
+        existing = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if CAPTURE_NAME.fullmatch(name) and os.path.isfile(path):
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, path, stat.st_size))
+        existing.sort()
+        self.files = [(path, size) for _, path, size in existing]
+        self.total_bytes = sum(size for _, size in self.files)
+
+    def capture(self, driver, task_id, attempt, error=None):
+        """Grab the failed page from ``driver`` and queue it to be written; never raises."""
+        if driver is None:
+            return
+        try:
+            page_source = driver.page_source
+            screenshot = driver.get_screenshot_as_base64() if self.screenshots else None
+            url = driver.current_url
+        except Exception as e:
+            logger.warning(f"Failed to capture diagnostics for {task_id}: {e}")
+            return
+
+        self.start()
+        record = {
+            "task_id": task_id,
+            "attempt": attempt,
+            "url": url,
+            "error": repr(error) if error is not None else None,
+            "timestamp": time.time(),
+        }
+        try:
+            self.captures.put_nowait((record, page_source, screenshot))
+        except queue.Full:
+            # Never stall a worker on diagnostics
+            metrics.inc("failure_captures_dropped_total")
+
+    def run(self):
+        while True:
+            item = self.captures.get()
+            if item is None:
+                self.captures.task_done()
+                break
+            try:
+                self.write(*item)
+            except Exception as e:
+                logger.warning(f"Failed to write diagnostics: {e}")
+            finally:
+                self.captures.task_done()
+
+    def write(self, record, page_source, screenshot):
+        stem = os.path.join(
+            self.directory,
+            f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(record['timestamp']))}-{safe_name(record['task_id'])}-a{record['attempt']}",
+        )
+        outputs = [
+            (f"{stem}.html.gz", gzip.compress(page_source.encode("utf-8"), compresslevel=6)),
+            (f"{stem}.json", json.dumps(record, indent=2).encode("utf-8")),
+        ]
+        if screenshot:
+            outputs.append((f"{stem}.png", base64.b64decode(screenshot)))
+
+        for path, content in outputs:
+            with open(path, "wb") as output_file:
+                output_file.write(content)
+            self.files.append((path, len(content)))
+            self.total_bytes += len(content)
+        metrics.inc("failure_captures_total")
+        self.trim()
+
+    def trim(self):
+        while self.total_bytes > self.max_bytes and self.files:
+            path, size = self.files.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.total_bytes -= size
+
+    def close(self):
+        """Wait for queued captures to be written."""
+        if self.thread is None:
+            return
+        self.captures.put(None)
+        self.thread.join()
+        self.thread = None
+
+
+failure_recorder = FailureRecorder()
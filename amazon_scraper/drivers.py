@@ -0,0 +1,444 @@
+"""Reusable Chrome drivers and ScrapeOps proxy-port mode.
+
+In proxy-port mode the browser talks to Amazon directly through
+``proxy.scrapeops.io:5353`` as an HTTP proxy, so URLs stay native and
+cookies, cache and keep-alive connections survive across pages. Chrome
+cannot send proxy credentials from the command line, so a small local
+forwarder adds the ``Proxy-Authorization`` header on the way out. HTTP
+clients such as the image downloader use ``proxy_pool_manager``, which
+sends the credentials itself.
+
+Selenium and urllib3 are only imported once a driver or proxy client is
+actually needed.
+"""
+import base64
+import logging
+import os
+import select
+import signal
+import socket
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import metrics
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+PROXY_HOST = "proxy.scrapeops.io"
+PROXY_PORT = 5353
+
+
+def is_session_error(error):
+    """True if ``error`` means the driver can no longer be trusted and should not be reused."""
+    if error is None:
+        return False
+    import urllib3
+    from selenium.common.exceptions import (
+        InvalidSessionIdException,
+        NoSuchWindowException,
+        SessionNotCreatedException,
+        WebDriverException,
+    )
+    session_errors = (InvalidSessionIdException, NoSuchWindowException, SessionNotCreatedException, urllib3.exceptions.HTTPError, ConnectionError)
+    return isinstance(error, session_errors) or type(error) is WebDriverException
+
+
+def proxy_credentials(api_key, location="us"):
+    return f"scrapeops.country={location}", api_key
+
+
+def proxy_pool_manager(api_key, location="us", maxsize=10, **kwargs):
+    """A pooled urllib3 client that sends requests through the ScrapeOps proxy port."""
+    import urllib3
+
+    username, password = proxy_credentials(api_key, location)
+    return urllib3.ProxyManager(
+        f"http://{PROXY_HOST}:{PROXY_PORT}",
+        proxy_headers=urllib3.make_headers(proxy_basic_auth=f"{username}:{password}"),
+        maxsize=maxsize,
+        # The proxy re-encrypts upstream TLS with its own certificate
+        cert_reqs="CERT_NONE",
+        **kwargs
+    )
+
+
+class ProxyForwardHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        client = self.request
+        head = b""
+        while b"\r\n\r\n" not in head:
+            chunk = client.recv(65536)
+            if not chunk:
+                return
+            head += chunk
+        head, _, body = head.partition(b"\r\n\r\n")
+        lines = head.split(b"\r\n")
+        is_connect = lines[0].upper().startswith(b"CONNECT ")
+
+        headers = [
+            line for line in lines[1:]
+            if not line.lower().startswith((b"proxy-authorization:", b"proxy-connection:", b"connection:"))
+        ]
+        headers.append(b"Proxy-Authorization: " + self.server.authorization)
+        if not is_connect:
+            # Later requests on a reused connection would bypass the header
+            # injection, so plain HTTP requests get one request per connection
+            headers.append(b"Connection: close")
+
+        try:
+            upstream = socket.create_connection(self.server.upstream, timeout=30)
+        except OSError as e:
+            logger.warning(f"Failed to connect to upstream proxy: {e}")
+            client.sendall(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+            return
+        with upstream:
+            upstream.sendall(b"\r\n".join([lines[0]] + headers) + b"\r\n\r\n" + body)
+            self.pipe(client, upstream)
+
+    def pipe(self, client, upstream):
+        sockets = [client, upstream]
+        while True:
+            readable, _, errored = select.select(sockets, [], sockets, 300)
+            if errored or not readable:
+                return
+            for source in readable:
+                data = source.recv(65536)
+                if not data:
+                    return
+                (upstream if source is client else client).sendall(data)
+
+
+class ProxyForwarder(socketserver.ThreadingTCPServer):
+    """Local unauthenticated HTTP proxy that forwards to the ScrapeOps proxy port."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, api_key, location="us", upstream=(PROXY_HOST, PROXY_PORT)):
+        super().__init__(("127.0.0.1", 0), ProxyForwardHandler)
+        username, password = proxy_credentials(api_key, location)
+        self.authorization = b"Basic " + base64.b64encode(f"{username}:{password}".encode())
+        self.upstream = upstream
+        self.thread = threading.Thread(target=self.serve_forever, name=f"proxy-forwarder-{location}", daemon=True)
+        self.thread.start()
+
+    @property
+    def address(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def proxy_port_options(base_options, forwarder):
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    for argument in base_options.arguments:
+        options.add_argument(argument)
+    options.add_argument(f"--proxy-server={forwarder.address}")
+    options.add_argument("--ignore-certificate-errors")
+    return options
+
+
+def list_processes():
+    """Return ``{pid: (parent_pid, name, age_seconds)}`` for every visible process."""
+    processes = {}
+    if psutil is not None:
+        now = time.time()
+        for process in psutil.process_iter(["ppid", "name", "create_time"]):
+            info = process.info
+            processes[process.pid] = (info["ppid"], info["name"] or "", now - (info["create_time"] or now))
+        return processes
+    if not os.path.isdir("/proc"):
+        return processes
+    ticks = os.sysconf("SC_CLK_TCK")
+    with open("/proc/uptime") as uptime_file:
+        uptime = float(uptime_file.read().split()[0])
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        fields = stat[stat.rindex(")") + 2:].split()
+        processes[int(entry)] = (int(fields[1]), name, uptime - int(fields[19]) / ticks)
+    return processes
+
+
+def process_tree(pid, processes=None):
+    processes = list_processes() if processes is None else processes
+    children = {}
+    for child, (parent, _, _) in processes.items():
+        children.setdefault(parent, []).append(child)
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def rss_bytes(pid):
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+    try:
+        with open(f"/proc/{pid}/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def kill_tree(pid, processes=None):
+    for member in reversed(process_tree(pid, processes)):
+        try:
+            os.kill(member, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def driver_pid(driver):
+    process = getattr(getattr(driver, "service", None), "process", None)
+    return getattr(process, "pid", None)
+
+
+class DriverWatchdog:
+    """Tracks Chrome process trees and decides when long-lived drivers get recycled.
+
+    A driver is due for recycling after ``max_pages`` pages or once its
+    chromedriver + Chrome process tree exceeds ``max_rss_mb``. Chromedriver
+    processes started by this process that no live driver owns (left behind
+    when ``webdriver.Chrome`` fails to construct) are killed by
+    ``reap_orphans``, which also runs every ``reap_interval`` seconds once
+    ``start`` is called.
+    """
+
+    def __init__(self, max_pages=200, max_rss_mb=1500, rss_check_every=10, reap_interval=60, orphan_min_age=60):
+        self.max_pages = max_pages
+        self.max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.rss_check_every = rss_check_every
+        self.reap_interval = reap_interval
+        self.orphan_min_age = orphan_min_age
+        self.pages = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def configure(self, max_pages=None, max_rss_mb=None):
+        """Change the recycle limits; a limit of 0 disables it, None leaves it as is."""
+        if max_pages is not None:
+            self.max_pages = max_pages
+        if max_rss_mb is not None:
+            self.max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+
+    def track(self, driver):
+        pid = driver_pid(driver)
+        with self.lock:
+            self.pages[pid] = 0
+
+    def forget(self, driver):
+        with self.lock:
+            self.pages.pop(driver_pid(driver), None)
+
+    def quit(self, driver):
+        self.forget(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"Failed to quit driver: {e}")
+            pid = driver_pid(driver)
+            if pid:
+                kill_tree(pid)
+
+    def tree_rss(self, driver):
+        pid = driver_pid(driver)
+        if pid is None:
+            return 0
+        return sum(rss_bytes(member) for member in process_tree(pid))
+
+    def page_served(self, driver):
+        """Count a page for ``driver``; returns True once it should be recycled."""
+        pid = driver_pid(driver)
+        with self.lock:
+            pages = self.pages[pid] = self.pages.get(pid, 0) + 1
+        if self.max_pages and pages >= self.max_pages:
+            metrics.inc("drivers_recycled_total", reason="pages")
+            return True
+        if self.max_rss and pages % self.rss_check_every == 0:
+            rss = self.tree_rss(driver)
+            metrics.observe("driver_rss_megabytes", rss / 1024 / 1024)
+            if rss > self.max_rss:
+                logger.info(f"Recycling driver {pid} using {rss / 1024 / 1024:.0f} MB after {pages} pages")
+                metrics.inc("drivers_recycled_total", reason="rss")
+                return True
+        return False
+
+    def reap_orphans(self):
+        processes = list_processes()
+        with self.lock:
+            owned = set(self.pages)
+        reaped = 0
+        for pid, (parent, name, age) in processes.items():
+            if parent != os.getpid() or "chromedriver" not in name or pid in owned:
+                continue
+            # Young processes may belong to a driver that is still being constructed
+            if age < self.orphan_min_age:
+                continue
+            logger.warning(f"Killing orphaned chromedriver {pid} and its children")
+            kill_tree(pid, processes)
+            reaped += 1
+        if reaped:
+            metrics.inc("orphaned_drivers_killed_total", reaped)
+        return reaped
+
+    def kill_all(self):
+        """Kill every tracked driver's process tree, failing whatever is waiting on it."""
+        with self.lock:
+            pids = [pid for pid in self.pages if pid]
+        processes = list_processes()
+        for pid in pids:
+            kill_tree(pid, processes)
+        if pids:
+            logger.warning(f"Killed {len(pids)} drivers")
+        return len(pids)
+
+    def start(self):
+        def run():
+            while not self.stopped.wait(self.reap_interval):
+                try:
+                    self.reap_orphans()
+                except Exception as e:
+                    logger.warning(f"Driver watchdog failed: {e}")
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=run, name="driver-watchdog", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class DriverPool:
+    """Keeps up to ``size`` Chrome drivers warm and hands them out to worker threads.
+
+    Drivers are created by ``driver_factory(location)`` and only reused for
+    the same location, since a proxy-port driver is bound to one country.
+    """
+
+    def __init__(self, driver_factory, size=3, watchdog=None):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.watchdog = watchdog
+        self.idle = {}
+        self.locations = {}
+        self.created = 0
+        self.lock = threading.Lock()
+        self.available = threading.Semaphore(size)
+        self.closed = False
+
+    def acquire(self, location="us"):
+        self.available.acquire()
+        evicted = None
+        with self.lock:
+            idle = self.idle.get(location)
+            if idle:
+                return idle.pop()
+            # Make room by dropping a warm driver that belongs to another location
+            if len(self.locations) >= self.size:
+                for other in self.idle.values():
+                    if other:
+                        evicted = other.pop(0)
+                        del self.locations[id(evicted)]
+                        break
+        if evicted is not None:
+            self.quit(evicted)
+        try:
+            with metrics.timer("stage_seconds", stage="pool_driver_launch"):
+                driver = self.driver_factory(location)
+        except Exception:
+            self.available.release()
+            raise
+        with self.lock:
+            self.created += 1
+            self.locations[id(driver)] = location
+        if self.watchdog is not None:
+            self.watchdog.track(driver)
+        return driver
+
+    def release(self, driver, error=None, served=True):
+        """Return ``driver`` to the pool, or quit it if ``error`` shows the session is broken.
+
+        ``served=False`` returns a driver that loaded no page, without counting one against it.
+        """
+        broken = is_session_error(error)
+        worn_out = self.watchdog is not None and served and not broken and self.watchdog.page_served(driver)
+        with self.lock:
+            keep = not (broken or worn_out or self.closed)
+            location = self.locations.get(id(driver))
+            if keep:
+                self.idle.setdefault(location, []).append(driver)
+            else:
+                self.locations.pop(id(driver), None)
+        if not keep:
+            self.quit(driver)
+        self.available.release()
+
+    def warm(self, location="us", count=None):
+        """Start ``count`` drivers for ``location`` (default: the pool size) and leave them idle."""
+        drivers = []
+        try:
+            for _ in range(count or self.size):
+                drivers.append(self.acquire(location))
+        finally:
+            for driver in drivers:
+                self.release(driver, served=False)
+        return len(drivers)
+
+    @contextmanager
+    def driver(self, location="us"):
+        driver = self.acquire(location)
+        error = None
+        try:
+            yield driver
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(driver, error)
+
+    def quit(self, driver):
+        if self.watchdog is not None:
+            self.watchdog.quit(driver)
+            return
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"Failed to quit driver: {e}")
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            drivers = [driver for idle in self.idle.values() for driver in idle]
+            self.idle.clear()
+            self.locations.clear()
+        for driver in drivers:
+            self.quit(driver)
@@ -0,0 +1,135 @@
+"""Concurrent product image downloader with content-addressed storage.
+
+Images are stored as ``<output_dir>/<aa>/<bb>/<sha256>.<ext>`` so identical
+files served under different URLs are kept once. ``index.jsonl`` in the
+output directory maps every URL seen to its digest, which lets later runs
+skip URLs that are already on disk without fetching them again. In
+ScrapeOps proxy-port mode the downloads go through the proxy too.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+
+from . import config
+from .drivers import proxy_pool_manager
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Amazon encodes resizing in the file name, e.g. 61abc._AC_US40_.jpg; dropping
+# the modifier returns the original full-size image.
+SIZE_MODIFIER = re.compile(r"\._[^/]+_(\.[a-zA-Z]+)$")
+
+
+def full_size_url(url):
+    return SIZE_MODIFIER.sub(r"\1", url)
+
+
+class ImageDownloader:
+
+    def __init__(self, output_dir="images", max_workers=8, max_pending=None, retries=3, timeout=30, full_size=True, http=None, location="us"):
+        self.output_dir = output_dir
+        self.full_size = full_size
+        if http is None:
+            pool_options = {
+                "maxsize": max_workers,
+                "retries": urllib3.Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)),
+                "timeout": urllib3.Timeout(connect=10, read=timeout),
+            }
+            if config.PROXY_MODE == "port":
+                http = proxy_pool_manager(config.API_KEY, location, **pool_options)
+            else:
+                http = urllib3.PoolManager(**pool_options)
+        self.http = http
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image")
+        self.slots = threading.BoundedSemaphore(max_pending or max_workers * 4)
+        self.lock = threading.Lock()
+        self.urls_seen = {}
+        self.digests_seen = {}
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.index_path = os.path.join(output_dir, "index.jsonl")
+        self.load_index()
+        self.index_file = open(self.index_path, "a", encoding="utf-8")
+
+    def load_index(self):
+        if not os.path.isfile(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if os.path.isfile(os.path.join(self.output_dir, entry["path"])):
+                    self.urls_seen[entry["url"]] = entry["sha256"]
+                    self.digests_seen[entry["sha256"]] = entry["path"]
+
+    def path_for(self, digest, url):
+        extension = os.path.splitext(url.split("?")[0])[1] or ".jpg"
+        return os.path.join(digest[:2], digest[2:4], digest + extension.lower())
+
+    def submit(self, asin, urls):
+        """Queue ``urls`` for download; blocks while too many downloads are pending."""
+        for url in urls:
+            if self.full_size:
+                url = full_size_url(url)
+            with self.lock:
+                if url in self.urls_seen:
+                    metrics.inc("images_skipped_total", reason="url")
+                    continue
+                # Reserve the URL so concurrent submitters don't fetch it twice
+                self.urls_seen[url] = None
+            self.slots.acquire()
+            future = self.executor.submit(self.download, asin, url)
+            future.add_done_callback(lambda _: self.slots.release())
+
+    def download(self, asin, url):
+        try:
+            with metrics.timer("stage_seconds", stage="image_download"):
+                response = self.http.request("GET", url, preload_content=True)
+            if response.status != 200:
+                raise urllib3.exceptions.HTTPError(f"HTTP {response.status}")
+            content = response.data
+        except Exception as e:
+            logger.warning(f"Failed to download image {url}: {e}")
+            metrics.inc("images_failed_total")
+            with self.lock:
+                self.urls_seen.pop(url, None)
+            return
+
+        digest = hashlib.sha256(content).hexdigest()
+
+        with self.lock:
+            relative_path = self.digests_seen.get(digest)
+            is_new = relative_path is None
+            if is_new:
+                relative_path = self.digests_seen[digest] = self.path_for(digest, url)
+
+        if is_new:
+            path = os.path.join(self.output_dir, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as image_file:
+                image_file.write(content)
+            os.replace(tmp_path, path)
+            metrics.inc("images_downloaded_total")
+            metrics.inc("image_bytes_total", len(content))
+        else:
+            metrics.inc("images_skipped_total", reason="content")
+
+        entry = {"url": url, "sha256": digest, "path": relative_path, "asin": asin}
+        with self.lock:
+            self.urls_seen[url] = digest
+            self.index_file.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.index_file.close()
+        self.http.clear()
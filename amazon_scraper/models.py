@@ -0,0 +1,65 @@
+from dataclasses import dataclass, field, fields
+
+
+# Slotted records are smaller and faster to read attributes from; the
+# pipeline encodes them straight to tuples
+@dataclass(slots=True)
+class ProductData:
+    name: str = ""
+    title: str = ""
+    url: str = ""
+    is_ad: bool = False
+    pricing_unit: str = ""
+    price: float = None
+    real_price: float = None
+    rating: float = None
+    location: str = "us"
+
+    def __post_init__(self):
+        self.check_string_fields()
+        
+    def check_string_fields(self):
+        for spec in fields(self):
+            # Check string fields
+            if isinstance(getattr(self, spec.name), str):
+                # If empty set default text
+                if getattr(self, spec.name) == '':
+                    setattr(self, spec.name, f"No {spec.name}")
+                    continue
+                # Strip any trailing spaces, etc.
+                value = getattr(self, spec.name)
+                setattr(self, spec.name, value.strip())
+
+@dataclass(slots=True)
+class ProductPageData:
+    name: str = ""
+    title: str = ""
+    url: str = ""
+    pricing_unit: str = ""
+    price: float = None
+    location: str = "us"
+    # The on-page #productTitle; ``title`` stays the URL slug the record is filed under
+    page_title: str = ""
+    # Variable-length fields are written to child tables, one row per entry
+    features: list = field(default_factory=list, metadata={"child_column": "feature"})
+    images: list = field(default_factory=list, metadata={"child_column": "url"})
+
+    def __post_init__(self):
+        self.check_string_fields()
+        
+    def check_string_fields(self):
+        for spec in fields(self):
+            # Check string fields
+            if isinstance(getattr(self, spec.name), str):
+                # If empty set default text
+                if getattr(self, spec.name) == '':
+                    setattr(self, spec.name, f"No {spec.name}")
+                    continue
+                # Strip any trailing spaces, etc.
+                value = getattr(self, spec.name)
+                setattr(self, spec.name, value.strip())
+
+
+def record_key(record):
+    # The same ASIN is a separate record in each marketplace
+    return f"{record.location}:{record.name}"
@@ -0,0 +1,148 @@
+"""Static (browser-free) parsers for fetched page HTML.
+
+These run on ``page_source`` strings rather than a live DOM, so they can be
+shipped to worker processes and scale across cores. They only depend on the
+standard library and the record models.
+"""
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from .models import ProductData
+from .urls import extract_asin
+
+BASE_URL = "https://www.amazon.com/"
+# Captured fields, keyed by the class that marks them on a search result card
+CARD_FIELDS = {
+    "a-price-symbol": "pricing_unit",
+    "a-price-whole": "price_whole",
+    "a-price-fraction": "price_fraction",
+    "a-icon-alt": "rating",
+}
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class SearchPageParser(HTMLParser):
+    """Collects the raw fields of every organic result card on a search page.
+
+    Cards are the ``s-search-result`` divs; ``AdHolder`` blocks are skipped
+    entirely, which replaces removing them from the DOM. Text inside
+    ``a-offscreen`` spans is ignored, matching what Selenium's ``.text``
+    returns for the same elements.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.cards = []
+        self.stack = []
+        self.card = None
+        self.card_depth = None
+        self.skip_depth = None
+        self.hidden_depth = None
+        self.captures = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        self.stack.append(tag)
+        depth = len(self.stack)
+        if self.skip_depth is not None:
+            return
+        attributes = dict(attrs)
+        classes = (attributes.get("class") or "").split()
+
+        if tag == "div" and "AdHolder" in classes:
+            self.skip_depth = depth
+            return
+        if self.card is None:
+            if tag == "div" and attributes.get("data-component-type") == "s-search-result":
+                self.card = {}
+                self.card_depth = depth
+            return
+
+        if "a-offscreen" in classes and self.hidden_depth is None:
+            self.hidden_depth = depth
+        if tag == "h2" and "title" not in self.card:
+            self.start_capture("title", depth)
+        elif tag == "a" and "url" not in self.card and any(name == "title" for name, _, _ in self.captures):
+            self.card["url"] = attributes.get("href") or ""
+        elif tag == "span" and "a-price" in classes and "a-text-price" in classes:
+            self.start_capture("real_price", depth)
+        for css_class, name in CARD_FIELDS.items():
+            if css_class in classes:
+                self.start_capture(name, depth)
+
+    def start_capture(self, name, depth):
+        if name not in self.card:
+            self.card[name] = None
+            self.captures.append((name, depth, []))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS or tag not in self.stack:
+            return
+        while self.stack:
+            depth = len(self.stack)
+            open_tag = self.stack.pop()
+            self.close_element(depth)
+            if open_tag == tag:
+                break
+
+    def close_element(self, depth):
+        if self.skip_depth == depth:
+            self.skip_depth = None
+        if self.hidden_depth == depth:
+            self.hidden_depth = None
+        while self.captures and self.captures[-1][1] >= depth:
+            name, _, parts = self.captures.pop()
+            self.card[name] = " ".join("".join(parts).split())
+        if self.card_depth == depth:
+            self.cards.append(self.card)
+            self.card = None
+            self.card_depth = None
+
+    def handle_data(self, data):
+        if self.hidden_depth is None:
+            for _, _, parts in self.captures:
+                parts.append(data)
+
+
+def parse_price(text, pricing_unit=""):
+    return float(text.replace(pricing_unit, "").replace(",", "").strip())
+
+
+def parse_search_page(html, location="us"):
+    """Parse a search results page into a list of ProductData records."""
+    parser = SearchPageParser()
+    parser.feed(html)
+    parser.close()
+
+    products = []
+    last_title = ""
+    for card in parser.cards:
+        title = card.get("title")
+        if not title or title == last_title:
+            continue
+        product_url = urljoin(BASE_URL, card.get("url") or "").replace("proxy.scrapeops.io", "www.amazon.com")
+        pricing_unit = card.get("pricing_unit")
+        if not pricing_unit:
+            continue
+
+        asin = extract_asin(product_url)
+        if asin is None:
+            continue
+        whole_number = (card.get("price_whole") or "").replace(",", "").rstrip(".")
+        price = float(f"{whole_number}.{card.get('price_fraction') or '00'}")
+        real_price = parse_price(card["real_price"], pricing_unit) if card.get("real_price") else price
+
+        products.append(ProductData(
+            name=asin,
+            title=title,
+            url=product_url,
+            is_ad="sspa" in product_url,
+            pricing_unit=pricing_unit,
+            price=price,
+            real_price=real_price,
+            rating=card.get("rating") or "",
+            location=location
+        ))
+        last_title = title
+    return products
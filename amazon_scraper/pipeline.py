@@ -0,0 +1,232 @@
+import logging
+import os
+import queue
+import threading
+from dataclasses import fields
+from functools import lru_cache
+from operator import attrgetter
+
+from .metrics import metrics
+from .models import record_key
+from .shutdown import shutdown
+from .sinks import open_sink
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def record_encoder(record_type):
+    """``(header, encode, children)`` for a record dataclass, worked out once per type.
+
+    ``encode(record)`` returns the row tuple for the parent table and
+    ``children`` lists ``(field_name, child_column)`` for the child tables.
+    """
+    item_fields = fields(record_type)
+    header = tuple(field.name for field in item_fields if "child_column" not in field.metadata)
+    children = tuple((field.name, field.metadata["child_column"]) for field in item_fields if "child_column" in field.metadata)
+    return header, attrgetter(*header), children
+
+
+class DataPipeline:
+    
+    def __init__(self, csv_filename='', storage_queue_limit=50, max_pending_batches=4, price_history=None, change_index=None, asin_index=None, rotate_rows=None, rotate_bytes=None, rotate_seconds=None, wal=None):
+        self.names_seen = set()
+        self.storage_queue = []
+        self.storage_queue_limit = storage_queue_limit
+        self.csv_filename = csv_filename
+        self.lock = threading.Lock()
+        # Full batches waiting for the writer thread. Once this fills up,
+        # add_data blocks, which throttles the scrapers to the write speed.
+        self.pending_batches = queue.Queue(maxsize=max_pending_batches)
+        self.writer_thread = None
+        # The first exception the writer thread hit and how many rows it lost, raised by close_pipeline
+        self.write_error = None
+        self.rows_lost = 0
+        self.price_history = price_history
+        # When set, only records whose content changed since the last run are written
+        self.change_index = change_index
+        # A shared AsinIndex replaces names_seen, so other pipelines' records count as duplicates too
+        self.asin_index = asin_index
+        # Open sinks by filename; with a rotate_* limit each one writes finalized shards
+        self.sinks = {}
+        self.rotation = {"max_rows": rotate_rows, "max_bytes": rotate_bytes, "interval": rotate_seconds}
+        # A WriteAheadLog makes every accepted record durable before add_data returns
+        self.wal = wal
+        if wal is not None:
+            self.recover()
+
+    def recover(self):
+        """Write out the records a crashed run logged but never got into the CSV."""
+        records = [record for record in self.wal.recover() if not self.is_duplicate(record)]
+        if records:
+            logger.info(f"Recovered {len(records)} records for {self.csv_filename} from the write-ahead log")
+            metrics.inc("wal_records_recovered_total", len(records))
+            self.save_to_csv(records)
+            self.sync_sinks()
+        self.wal.discard_recovered()
+    
+    def save_to_csv(self, data_to_save):
+        if not data_to_save:
+            return
+
+        header, encode, children = record_encoder(type(data_to_save[0]))
+
+        with metrics.timer("stage_seconds", stage="save_to_csv"):
+            self.append_rows(self.csv_filename, header, list(map(encode, data_to_save)))
+            for field_name, child_column in children:
+                self.append_rows(
+                    self.child_filename(field_name),
+                    # The same ASIN can be a record in several locations, so
+                    # child rows join back to their record on name and location
+                    ("name", "location", "position", child_column),
+                    [
+                        (item.name, item.location, position, value)
+                        for item in data_to_save
+                        for position, value in enumerate(getattr(item, field_name), start=1)
+                    ]
+                )
+        metrics.inc("rows_written_total", len(data_to_save))
+
+    def child_filename(self, field_name):
+        stem, extension = os.path.splitext(self.csv_filename)
+        return f"{stem}_{field_name}{extension or '.csv'}"
+
+    def append_rows(self, filename, header, rows):
+        if not rows:
+            return
+        sink = self.sinks.get(filename)
+        if sink is None:
+            sink = self.sinks[filename] = open_sink(filename, header, **self.rotation)
+        sink.write_rows(rows)
+
+    def sync_sinks(self):
+        for sink in self.sinks.values():
+            sink.sync()
+
+    def save_batch(self, batch, segment=None):
+        """Write a batch, then release its write-ahead log segment once the rows are on disk."""
+        self.save_to_csv(batch)
+        if segment is not None:
+            self.sync_sinks()
+            self.wal.release(segment)
+
+    def close_sinks(self):
+        sinks, self.sinks = self.sinks, {}
+        for sink in sinks.values():
+            sink.close()
+
+    def write_batches(self):
+        while True:
+            item = self.pending_batches.get()
+            if item is None:
+                break
+            batch, segment = item
+            try:
+                self.save_batch(batch, segment)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} rows to {self.csv_filename}: {e}")
+                metrics.inc("rows_lost_total", len(batch))
+                self.rows_lost += len(batch)
+                if self.write_error is None:
+                    self.write_error = e
+
+    def enqueue_batch(self, batch, segment=None):
+        if self.writer_thread is None:
+            with self.lock:
+                if self.writer_thread is None:
+                    self.writer_thread = threading.Thread(target=self.write_batches, name=f"writer-{self.csv_filename}", daemon=True)
+                    self.writer_thread.start()
+        try:
+            self.pending_batches.put_nowait((batch, segment))
+        except queue.Full:
+            metrics.inc("backpressure_waits_total")
+            self.pending_batches.put((batch, segment))
+                    
+    def is_duplicate(self, input_data):
+        key = record_key(input_data)
+        if self.asin_index is not None:
+            duplicate = not self.asin_index.mark_seen(key)
+        else:
+            duplicate = key in self.names_seen
+            self.names_seen.add(key)
+        if duplicate:
+            logger.warning(f"Duplicate item found: {key}. Item dropped.")
+            metrics.inc("duplicates_total")
+        return duplicate
+            
+    def accepts(self, scraped_data):
+        """Dedupe ``scraped_data`` and record its price; True if it should be stored."""
+        if self.is_duplicate(scraped_data):
+            return False
+        if self.price_history is not None and self.price_history.record_product(scraped_data, key=record_key(scraped_data)):
+            metrics.inc("price_changes_total")
+        if self.change_index is not None and not self.change_index.has_changed(scraped_data, key=record_key(scraped_data)):
+            metrics.inc("unchanged_total")
+            return False
+        return True
+
+    def add_data(self, scraped_data):
+        self.add_many([scraped_data])
+
+    def add_many(self, records):
+        """Add several records at once, e.g. one page of results.
+
+        With a write-ahead log they are appended together and made durable
+        by a single commit, instead of one fsync per record.
+        """
+        batches = []
+        sequence = None
+        with self.lock:
+            accepted = [record for record in records if self.accepts(record)]
+            while accepted:
+                # Full batches are handed off as they fill, so there is always room
+                room = self.storage_queue_limit - len(self.storage_queue)
+                chunk, accepted = accepted[:room], accepted[room:]
+                self.storage_queue.extend(chunk)
+                if self.wal is not None:
+                    sequence = self.wal.write_many(chunk)
+                if len(self.storage_queue) >= self.storage_queue_limit:
+                    batch = self.storage_queue
+                    self.storage_queue = []
+                    # The segment holds exactly this batch, since both are filled under the lock
+                    segment = self.wal.rotate() if self.wal is not None else None
+                    batches.append((batch, segment))
+        # Wait for the group fsync outside the lock so other threads can join it
+        if sequence is not None:
+            self.wal.commit(sequence)
+        for batch, segment in batches:
+            self.enqueue_batch(batch, segment)
+                       
+    def close_pipeline(self):
+        with self.lock:
+            batch = self.storage_queue
+            self.storage_queue = []
+        segment = self.wal.close() if self.wal is not None else None
+        if self.writer_thread is None:
+            self.save_batch(batch, segment)
+        else:
+            if batch:
+                self.pending_batches.put((batch, segment))
+            self.pending_batches.put(None)
+            self.writer_thread.join()
+            self.writer_thread = None
+        self.close_sinks()
+        if self.write_error is not None:
+            error, self.write_error = self.write_error, None
+            raise RuntimeError(f"Lost {self.rows_lost} rows that could not be written to {self.csv_filename}") from error
+
+
+def submit_bounded(executor, fn, tasks, max_pending):
+    """Submit ``fn(*task)`` for each task, keeping at most ``max_pending`` outstanding.
+
+    ``tasks`` is consumed lazily, so large inputs are never fully materialized,
+    and stops being consumed once a shutdown is requested.
+    """
+    slots = threading.BoundedSemaphore(max_pending)
+    for task in tasks:
+        if shutdown.stopping:
+            logger.info("Shutting down, not submitting further tasks")
+            break
+        slots.acquire()
+        future = executor.submit(fn, *task)
+        future.add_done_callback(lambda _: slots.release())
@@ -0,0 +1,220 @@
+"""Change-only price history keyed by ASIN.
+
+Every observation is compared with the last known state of its ASIN and
+only changes are appended to the log, one line per change:
+
+    K<TAB>asin<TAB>timestamp<TAB>price<TAB>real_price<TAB>rating   keyframe, absolute values
+    D<TAB>asin<TAB>dt<TAB>dprice<TAB>dreal_price<TAB>rating        delta from the previous line for asin
+
+Timestamps are whole seconds and prices are integer cents. In a delta line
+an empty field means "unchanged" and ``x`` means the value became unknown.
+The log is replayed into memory on open, so point-in-time queries are a
+binary search over the (small) list of changes for one ASIN.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+PricePoint = namedtuple("PricePoint", ["timestamp", "price", "real_price", "rating"])
+
+NULL = "x"
+
+
+def to_cents(value):
+    if value is None or value == "":
+        return None
+    return int(round(float(value) * 100))
+
+
+def from_cents(cents):
+    return None if cents is None else cents / 100
+
+
+def clean_rating(rating):
+    if rating is None or rating == "":
+        return None
+    return str(rating).replace("\t", " ").replace("\n", " ")
+
+
+def encode_absolute(value):
+    return NULL if value is None else str(value)
+
+
+def decode_absolute(field, convert=int):
+    return None if field == NULL else convert(field)
+
+
+def encode_delta(previous, current):
+    if current == previous:
+        return ""
+    if current is None:
+        return NULL
+    if previous is None:
+        # Deltas are relative, so a value reappearing after an unknown gets a
+        # leading "=" to mark it as absolute
+        return f"={current}"
+    return str(current - previous)
+
+
+def decode_delta(field, previous):
+    if field == "":
+        return previous
+    if field == NULL:
+        return None
+    if field.startswith("="):
+        return int(field[1:])
+    return previous + int(field)
+
+
+class PriceHistoryStore:
+
+    def __init__(self, path="price_history.log"):
+        self.path = path
+        self.history = {}
+        self.lock = threading.Lock()
+        self.load()
+        self.log_file = open(self.path, "a", encoding="utf-8")
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, encoding="utf-8") as log_file:
+            for line_number, line in enumerate(log_file, start=1):
+                if not line.endswith("\n"):
+                    logger.warning(f"Ignoring truncated line {line_number} in {self.path}")
+                    break
+                try:
+                    self.apply(line.rstrip("\n").split("\t"))
+                except (ValueError, IndexError, KeyError) as e:
+                    logger.warning(f"Ignoring bad line {line_number} in {self.path}: {e}")
+
+    def apply(self, parts):
+        kind, asin, ts, price, real_price, rating = parts
+        points = self.history.setdefault(asin, [])
+        if kind == "K":
+            point = PricePoint(
+                int(ts),
+                decode_absolute(price),
+                decode_absolute(real_price),
+                decode_absolute(rating, str),
+            )
+        else:
+            last = points[-1]
+            point = PricePoint(
+                last.timestamp + int(ts),
+                decode_delta(price, last.price),
+                decode_delta(real_price, last.real_price),
+                last.rating if rating == "" else decode_absolute(rating, str),
+            )
+        points.append(point)
+
+    def encode(self, asin, point, last):
+        if last is None:
+            fields = [
+                "K", asin, str(point.timestamp),
+                encode_absolute(point.price), encode_absolute(point.real_price), encode_absolute(point.rating),
+            ]
+        else:
+            fields = [
+                "D", asin, str(point.timestamp - last.timestamp),
+                encode_delta(last.price, point.price),
+                encode_delta(last.real_price, point.real_price),
+                "" if point.rating == last.rating else encode_absolute(point.rating),
+            ]
+        return "\t".join(fields) + "\n"
+
+    def record(self, asin, price, real_price=None, rating=None, timestamp=None):
+        """Record an observation; returns True if it differed from the last one and was written."""
+        point = PricePoint(
+            int(time.time() if timestamp is None else timestamp),
+            to_cents(price),
+            to_cents(real_price),
+            clean_rating(rating),
+        )
+        with self.lock:
+            points = self.history.setdefault(asin, [])
+            last = points[-1] if points else None
+            if last is not None and last[1:] == point[1:]:
+                return False
+            if last is not None and point.timestamp < last.timestamp:
+                # Keep each ASIN's log monotonic; late observations are stamped at the last change
+                point = point._replace(timestamp=last.timestamp)
+            self.log_file.write(self.encode(asin, point, last))
+            points.append(point)
+            return True
+
+    def record_product(self, product, timestamp=None, key=None):
+        return self.record(
+            product.name if key is None else key,
+            getattr(product, "price", None),
+            getattr(product, "real_price", None),
+            getattr(product, "rating", None),
+            timestamp,
+        )
+
+    def export_point(self, point):
+        return point._replace(price=from_cents(point.price), real_price=from_cents(point.real_price))
+
+    def price_at(self, asin, timestamp):
+        """Return the PricePoint in effect for ``asin`` at ``timestamp``, or None."""
+        with self.lock:
+            points = self.history.get(asin)
+            if not points:
+                return None
+            index = bisect_right(points, timestamp, key=lambda point: point.timestamp)
+            if index == 0:
+                return None
+            return self.export_point(points[index - 1])
+
+    def changes_since(self, timestamp, asin=None):
+        """Return ``(asin, PricePoint)`` for every change strictly after ``timestamp``."""
+        with self.lock:
+            asins = [asin] if asin is not None else list(self.history)
+            changes = []
+            for key in asins:
+                points = self.history.get(key, [])
+                index = bisect_right(points, timestamp, key=lambda point: point.timestamp)
+                changes.extend((key, self.export_point(point)) for point in points[index:])
+        changes.sort(key=lambda change: change[1].timestamp)
+        return changes
+
+    def flush(self):
+        with self.lock:
+            self.log_file.flush()
+
+    def compact(self, before=None):
+        """Rewrite the log with one keyframe per ASIN followed by its deltas.
+
+        Changes older than ``before`` are dropped except the one still in
+        effect at ``before``, which keeps its own timestamp so ``price_at``
+        answers the same for every time from then on.
+        """
+        with self.lock:
+            if before is not None:
+                for asin, points in self.history.items():
+                    index = bisect_right(points, before, key=lambda point: point.timestamp)
+                    if index > 1:
+                        self.history[asin] = points[index - 1:]
+
+            tmp_path = f"{self.path}.compact"
+            with open(tmp_path, "w", encoding="utf-8") as compact_file:
+                for asin, points in self.history.items():
+                    last = None
+                    for point in points:
+                        compact_file.write(self.encode(asin, point, last))
+                        last = point
+                compact_file.flush()
+                os.fsync(compact_file.fileno())
+
+            self.log_file.close()
+            os.replace(tmp_path, self.path)
+            self.log_file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self.lock:
+            self.log_file.close()
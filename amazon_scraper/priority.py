@@ -0,0 +1,146 @@
+"""Ordering and budgeting of product detail lookups.
+
+Search result rows are pushed onto a heap keyed by a scoring function
+(higher scores are looked up first), so when a time or credit budget ends a
+run early the most valuable product pages are already done. Ordering has to
+read every row first, so it is opt-in; ``within_budget`` keeps file order
+and streams.
+"""
+import heapq
+import importlib
+import logging
+import re
+import threading
+import time
+
+from .metrics import metrics
+from .urls import unique_lookups
+
+logger = logging.getLogger(__name__)
+
+# Position of the card in the search results, e.g. sr=8-21 or ref=sr_1_21
+RANK_PATTERNS = (re.compile(r"[?&]sr=\d+-(\d+)"), re.compile(r"/ref=sr_\d+_(\d+)"))
+
+
+def search_rank(row, default=None):
+    url = row.get("url") or ""
+    for pattern in RANK_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return int(match.group(1))
+    return default
+
+
+def row_price(row, column="price"):
+    try:
+        return float(row.get(column) or 0)
+    except ValueError:
+        return 0.0
+
+
+def is_ad(row):
+    return str(row.get("is_ad")).lower() == "true"
+
+
+def by_rank(row, position):
+    return -search_rank(row, position)
+
+
+def organic_first(row, position):
+    return (not is_ad(row), -search_rank(row, position))
+
+
+def by_price(row, position):
+    return (row_price(row), -position)
+
+
+def by_discount(row, position):
+    return (row_price(row, "real_price") - row_price(row), -position)
+
+
+PRIORITIES = {
+    "rank": by_rank,
+    "organic": organic_first,
+    "price": by_price,
+    "discount": by_discount,
+}
+
+
+def resolve_priority(priority):
+    """Accept a PRIORITIES name, a ``module:function`` path or a callable ``score(row, position)``."""
+    if callable(priority):
+        return priority
+    if priority in PRIORITIES:
+        return PRIORITIES[priority]
+    module_name, _, function_name = str(priority).partition(":")
+    if not function_name:
+        raise ValueError(f"Unknown priority {priority!r}, expected one of {sorted(PRIORITIES)} or module:function")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class LookupBudget:
+    """Stops lookups after ``seconds`` of wall time or ``credits`` proxy requests."""
+
+    def __init__(self, seconds=None, credits=None):
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.credits = credits
+        self.spent = 0
+        self.lock = threading.Lock()
+
+    def exhausted(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.credits is not None and self.spent >= self.credits
+
+    def spend(self, credits=1):
+        """Reserve ``credits``; returns False, reserving nothing, once the budget is used up."""
+        with self.lock:
+            if self.exhausted():
+                return False
+            self.spent += credits
+            return True
+
+
+class Descending:
+    """Inverts the ordering of a score so the min-heap pops the highest score first."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def prioritized(rows, priority="organic", budget=None, location="us"):
+    """Yield ``rows`` best first, dropping repeated products and stopping when ``budget`` runs out."""
+    score = resolve_priority(priority)
+    heap = []
+    for position, row in enumerate(unique_lookups(rows, location), start=1):
+        # position breaks ties, so rows themselves are never compared
+        heap.append((Descending(score(row, position)), position, row))
+    heapq.heapify(heap)
+
+    while heap:
+        if budget is not None and budget.exhausted():
+            metrics.inc("products_skipped_total", len(heap), reason="budget")
+            logger.info(f"Lookup budget exhausted, skipping {len(heap)} lower priority products")
+            return
+        yield heapq.heappop(heap)[2]
+
+
+def within_budget(rows, budget):
+    """Yield ``rows`` in their own order until ``budget`` runs out, without reading ahead."""
+    rows = iter(rows)
+    for row in rows:
+        if budget.exhausted():
+            skipped = 1 + sum(1 for _ in rows)
+            metrics.inc("products_skipped_total", skipped, reason="budget")
+            logger.info(f"Lookup budget exhausted, skipping {skipped} remaining products")
+            return
+        yield row
+
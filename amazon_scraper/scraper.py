@@ -0,0 +1,868 @@
+"""Search and product page scraping through the ScrapeOps proxy.
+
+Selenium is imported the first time a driver is created, so importing this
+module (or running CLI commands that never open a browser) stays cheap.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from urllib.parse import urlencode
+
+from . import config
+from .diagnostics import failure_recorder
+from .drivers import DriverWatchdog, ProxyForwarder, kill_tree, proxy_port_options
+from .metrics import metrics
+from .models import ProductData, ProductPageData
+from .parsers import parse_search_page
+from .asin_index import unscraped_lookups
+from .pipeline import DataPipeline, submit_bounded
+from .priority import LookupBudget, prioritized, within_budget
+from .shutdown import remove_checkpoint, shutdown, write_checkpoint
+from .sinks import read_rows
+from .tracing import tracer
+from .urls import canonical_url, extract_asin, title_slug, unique_lookups
+from .wal import WriteAheadLog
+
+logger = logging.getLogger(__name__)
+
+OPTIONS = None
+OPTIONS_LOCK = threading.Lock()
+PROXY_FORWARDERS = {}
+PROXY_FORWARDERS_LOCK = threading.Lock()
+# Long-lived (pooled) drivers are recycled after this many pages or this much
+# memory across the chromedriver + Chrome process tree; CrawlEngine
+# configures both from driver_max_pages and driver_max_rss_mb
+DRIVER_WATCHDOG = DriverWatchdog(max_pages=200, max_rss_mb=1500)
+
+
+def chrome_options():
+    global OPTIONS
+    with OPTIONS_LOCK:
+        if OPTIONS is None:
+            from selenium.webdriver import ChromeOptions
+
+            OPTIONS = ChromeOptions()
+            if config.HEADLESS:
+                OPTIONS.add_argument("--headless")
+    return OPTIONS
+
+
+def get_scrapeops_url(url, location="us"):
+    if config.PROXY_MODE == "port":
+        return url
+    payload = {
+        "api_key": config.API_KEY,
+        "url": url,
+        "country": location
+    }
+    proxy_url = config.PROXY_ENDPOINT + "?" + urlencode(payload)
+    return proxy_url
+
+
+def create_driver(location="us"):
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    options = chrome_options()
+    if config.PROXY_MODE == "port":
+        with PROXY_FORWARDERS_LOCK:
+            forwarder = PROXY_FORWARDERS.get(location)
+            if forwarder is None:
+                forwarder = PROXY_FORWARDERS[location] = ProxyForwarder(config.API_KEY, location)
+        options = proxy_port_options(options, forwarder)
+    service = Service()
+    try:
+        driver = webdriver.Chrome(options=options, service=service)
+    except Exception:
+        # A failed start can leave chromedriver running with nothing owning
+        # it; this one is too young for the orphan reaper, so kill it here
+        process = getattr(service, "process", None)
+        if process is not None:
+            kill_tree(process.pid)
+        DRIVER_WATCHDOG.reap_orphans()
+        raise
+    DRIVER_WATCHDOG.track(driver)
+    return driver
+
+
+def close_proxy_forwarders():
+    """Stop the local proxy-port forwarders, which would otherwise outlive the drivers using them."""
+    with PROXY_FORWARDERS_LOCK:
+        forwarders = list(PROXY_FORWARDERS.values())
+        PROXY_FORWARDERS.clear()
+    for forwarder in forwarders:
+        forwarder.close()
+
+
+def release_driver(driver, driver_pool=None, error=None):
+    if driver is None:
+        return
+    if driver_pool:
+        driver_pool.release(driver, error)
+    else:
+        DRIVER_WATCHDOG.quit(driver)
+
+
+def search_products(product_name: str, page_number=1, location="us", retries=3, data_pipeline=None, driver_pool=None, archive=None):
+    """Scrape one search results page into ``data_pipeline``; returns True if it succeeded."""
+    from selenium.webdriver.common.by import By
+
+    tries = 0
+    success = False
+    labels = {"keyword": product_name, "page": page_number, "location": location}
+
+
+    with tracer.span("search_products", **labels) as root_span:
+        # Once shutting down, only the attempt already in a browser runs to completion
+        while tries < retries and not success and not shutdown.stopping:
+            with tracer.span("attempt", attempt=tries + 1) as attempt_span:
+                error = None
+                driver = None
+                try:
+                    with tracer.span("driver_launch"), metrics.timer("stage_seconds", stage="driver_launch", **labels):
+                        driver = driver_pool.acquire(location) if driver_pool else create_driver(location)
+                    url = f"https://www.amazon.com/s?k={product_name}&page={page_number}"
+                    with tracer.span("build_proxy_url"):
+                        proxy_url = get_scrapeops_url(url, location)
+                    metrics.inc("proxy_credits_total", **labels)
+                    with tracer.span("navigate", url=url), metrics.timer("stage_seconds", stage="navigate", **labels):
+                        driver.get(proxy_url)
+                    if archive is not None:
+                        with tracer.span("archive"):
+                            archive.write(url, driver.page_source, kind="search", location=location)
+
+                    logger.info("Successfully fetched page")
+                
+            
+                    bad_divs = driver.find_elements(By.CSS_SELECTOR, "div.AdHolder")
+
+                    last_title = ""
+
+            
+                    with tracer.span("ad_removal", ads=len(bad_divs)), metrics.timer("stage_seconds", stage="ad_removal", **labels):
+                        for bad_div in bad_divs:
+                            driver.execute_script("""
+                                var element = arguments[0];
+                                element.parentNode.removeChild(element);
+                            """, bad_div)
+
+                    cards = 0
+                    with tracer.span("extract") as extract_span, metrics.timer("stage_seconds", stage="card_loop", **labels):
+                        divs = driver.find_elements(By.TAG_NAME, "div")
+                        extract_span.set_attribute("dom.div_count", len(divs))
+
+                        copied_divs = divs
+
+                        last_title = ""
+                        for div in copied_divs:
+                            h2s = div.find_elements(By.TAG_NAME, "h2")
+                
+                            parsable = len(h2s) > 0
+                            if parsable:
+                                h2 = div.find_element(By.TAG_NAME, "h2")
+                
+                            if h2 and parsable:
+                                title = h2.text
+
+                                if title == last_title:
+                                    continue
+
+                                a = h2.find_element(By.TAG_NAME, "a")
+                        
+                                product_url = (a.get_attribute("href") if a else "").replace("proxy.scrapeops.io", "www.amazon.com")
+
+                                ad_status = False
+                                if "sspa" in product_url:
+                                    ad_status = True
+
+                                asin = extract_asin(product_url)
+                                if asin is None:
+                                    continue
+
+                                price_symbols_array = div.find_elements(By.CSS_SELECTOR, "span.a-price-symbol")
+                                has_price = len(price_symbols_array) > 0
+
+                                if not has_price:
+                                    continue
+
+                                symbol_element = div.find_element(By.CSS_SELECTOR, "span.a-price-symbol")
+
+                                pricing_unit = symbol_element.text
+                        
+                                price_whole = div.find_element(By.CSS_SELECTOR, "span.a-price-whole")
+
+                                price_decimal = div.find_element(By.CSS_SELECTOR, "span.a-price-fraction")
+
+                        
+                                price_str = f"{price_whole.text}.{price_decimal.text}"
+                        
+                                rating_element = div.find_element(By.CLASS_NAME, "a-icon-alt")
+                                rating = rating_element.get_attribute("innerHTML")
+
+
+                                price = float(price_str)
+
+                                real_price_array = div.find_elements(By.CSS_SELECTOR, "span.a-price.a-text-price")
+
+        
+                                real_price = 0.0                        
+                                if len(real_price_array) > 0:
+                                    real_price_str = real_price_array[0].text.replace(pricing_unit, "")
+                                    real_price = float(real_price_str)
+                                else:
+                                    real_price = price
+
+                                product = ProductData(
+                                    name=asin,
+                                    title=title,
+                                    url=product_url,
+                                    is_ad=ad_status,
+                                    pricing_unit=pricing_unit,
+                                    price=price,
+                                    real_price=real_price,
+                                    rating=rating,
+                                    location=location
+                                )
+                                with tracer.span("pipeline_enqueue", asin=asin):
+                                    data_pipeline.add_data(product)
+                                metrics.inc("cards_total", **labels)
+                                cards += 1
+
+                                last_title = title
+
+                            else:
+                                continue
+                        extract_span.set_attribute("cards", cards)
+                    metrics.inc("pages_succeeded_total", **labels)
+                    success = True
+
+                    if not success:        
+                        raise Exception(f"Failed to scrape the page {page_number}, tries left: {retries-tries}")
+            
+    
+                except Exception as e:
+                    error = e
+                    attempt_span.record_exception(e)
+                    failure_recorder.capture(driver, f"search-{product_name}-p{page_number}-{location}", tries + 1, e)
+                    logger.warning(f"Failed to scrape page, {e}")
+                    metrics.inc("retries_total", **labels)
+                    tries += 1
+
+                finally:    
+                    release_driver(driver, driver_pool, error)
+    
+        
+        root_span.set_attribute("attempts", tries + int(success))
+        root_span.set_attribute("success", success)
+        if not success and shutdown.stopping:
+            metrics.inc("pages_skipped_total", reason="shutdown")
+        elif not success:
+            logger.warning(f"Failed to scrape page, retries exceeded: {retries}")
+            metrics.inc("pages_failed_total", **labels)
+    return success
+
+
+def threaded_search(product_name, pages, max_workers=5, location="us", retries=3, price_history=None, change_index=None, driver_pool=None, data_pipeline=None, archive=None, asin_index=None):
+    """Search ``pages`` pages of ``product_name``; returns the page numbers that yielded no results page."""
+    search_pipeline = data_pipeline or DataPipeline(csv_filename=f"{product_name}.csv", price_history=price_history, change_index=change_index, asin_index=asin_index)
+    succeeded = set()
+
+    def search_page(*task):
+        if search_products(*task):
+            succeeded.add(task[1])
+
+    tasks = (
+        (product_name, page, location, retries, search_pipeline, driver_pool, archive)
+        for page in range(1, pages+1)
+    )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:                
+        submit_bounded(executor, search_page, tasks, max_pending=max_workers * 2)
+
+    if data_pipeline is None:
+        search_pipeline.close_pipeline()
+    return [page for page in range(1, pages+1) if page not in succeeded]
+
+
+def fetch_search_page(product_name, page_number=1, location="us", retries=3, driver_pool=None, archive=None):
+    """Fetch one search results page and return its HTML, or None once retries run out."""
+    tries = 0
+    labels = {"keyword": product_name, "page": page_number, "location": location}
+
+    with tracer.span("fetch_search_page", **labels) as root_span:
+        while tries < retries and not shutdown.stopping:
+            with tracer.span("attempt", attempt=tries + 1) as attempt_span:
+                error = None
+                driver = None
+                try:
+                    with tracer.span("driver_launch"), metrics.timer("stage_seconds", stage="driver_launch", **labels):
+                        driver = driver_pool.acquire(location) if driver_pool else create_driver(location)
+                    url = f"https://www.amazon.com/s?k={product_name}&page={page_number}"
+                    with tracer.span("build_proxy_url"):
+                        proxy_url = get_scrapeops_url(url, location)
+                    metrics.inc("proxy_credits_total", **labels)
+                    with tracer.span("navigate", url=url), metrics.timer("stage_seconds", stage="navigate", **labels):
+                        driver.get(proxy_url)
+                    with tracer.span("page_source"), metrics.timer("stage_seconds", stage="page_source", **labels):
+                        html = driver.page_source
+                    if archive is not None:
+                        with tracer.span("archive"):
+                            archive.write(url, html, kind="search", location=location)
+                    root_span.set_attribute("attempts", tries + 1)
+                    return html
+                except Exception as e:
+                    error = e
+                    attempt_span.record_exception(e)
+                    failure_recorder.capture(driver, f"search-{product_name}-p{page_number}-{location}", tries + 1, e)
+                    logger.warning(f"Failed to fetch page, {e}")
+                    metrics.inc("retries_total", **labels)
+                    tries += 1
+                finally:
+                    release_driver(driver, driver_pool, error)
+
+        root_span.set_attribute("attempts", tries)
+        root_span.set_attribute("success", False)
+    if shutdown.stopping:
+        metrics.inc("pages_skipped_total", reason="shutdown")
+        return None
+    logger.warning(f"Failed to scrape page, retries exceeded: {retries}")
+    metrics.inc("pages_failed_total", **labels)
+    return None
+
+
+def staged_search(product_name, pages, fetch_workers=5, parse_workers=None, location="us", retries=3, price_history=None, change_index=None, driver_pool=None, data_pipeline=None, parse_executor=None, archive=None, asin_index=None):
+    """Search with separate fetch, parse and write stages.
+
+    ``fetch_workers`` browser threads only fetch raw HTML, which is parsed
+    by ``parse_search_page`` in a process pool of ``parse_workers``
+    processes (or in ``parse_executor`` when one is shared between
+    searches), and the parsed records are written from this thread. Returns
+    the page numbers that could not be fetched or parsed.
+    """
+    search_pipeline = data_pipeline or DataPipeline(csv_filename=f"{product_name}.csv", price_history=price_history, change_index=change_index, asin_index=asin_index)
+    parsers = parse_executor or ProcessPoolExecutor(max_workers=parse_workers or os.cpu_count())
+    succeeded = set()
+
+    try:
+        with ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="fetch") as fetchers:
+            pending = {
+                fetchers.submit(fetch_search_page, product_name, page, location, retries, driver_pool, archive): ("fetch", page)
+                for page in range(1, pages+1)
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, page = pending.pop(future)
+                    labels = {"keyword": product_name, "page": page, "location": location}
+                    if stage == "fetch":
+                        html = future.result()
+                        if html is not None:
+                            pending[parsers.submit(parse_search_page, html, location)] = ("parse", page)
+                        continue
+                    try:
+                        products = future.result()
+                    except Exception as e:
+                        logger.warning(f"Failed to parse page {page} of {product_name}: {e}")
+                        metrics.inc("pages_failed_total", **labels)
+                        continue
+                    with tracer.span("pipeline_enqueue", cards=len(products), **labels):
+                        search_pipeline.add_many(products)
+                    metrics.inc("cards_total", len(products), **labels)
+                    metrics.inc("pages_succeeded_total", **labels)
+                    succeeded.add(page)
+    finally:
+        if parse_executor is None:
+            parsers.shutdown()
+
+    if data_pipeline is None:
+        search_pipeline.close_pipeline()
+    return [page for page in range(1, pages+1) if page not in succeeded]
+
+
+def multi_region_search(product_name, pages, locations, max_workers=2, retries=3, price_history=None, change_index=None, driver_pool=None, parse_executor=None, archive=None, asin_index=None, data_pipeline=None):
+    """Search every location concurrently into one region-tagged ``{product_name}.csv``.
+
+    ``max_workers`` is the concurrency limit per region, either one number
+    for all regions or a dict of ``{location: workers}``. With a
+    ``parse_executor`` each region runs a ``staged_search`` sharing it.
+    Returns ``(location, page)`` for every page that failed.
+    """
+    search_pipeline = data_pipeline or DataPipeline(csv_filename=f"{product_name}.csv", price_history=price_history, change_index=change_index, asin_index=asin_index)
+
+    with ThreadPoolExecutor(max_workers=len(locations)) as executor:
+        futures = []
+        for location in locations:
+            workers = max_workers.get(location, 2) if isinstance(max_workers, dict) else max_workers
+            if parse_executor is not None:
+                search, concurrency = staged_search, {"fetch_workers": workers, "parse_executor": parse_executor}
+            else:
+                search, concurrency = threaded_search, {"max_workers": workers}
+            futures.append(executor.submit(
+                search,
+                product_name,
+                pages,
+                location=location,
+                retries=retries,
+                driver_pool=driver_pool,
+                data_pipeline=search_pipeline,
+                archive=archive,
+                **concurrency
+            ))
+        failed = []
+        for location, future in zip(locations, futures):
+            try:
+                failed.extend((location, page) for page in future.result())
+            except Exception as e:
+                logger.error(f"Search for {product_name} in {location} failed: {e}")
+                failed.extend((location, page) for page in range(1, pages+1))
+
+    if data_pipeline is None:
+        search_pipeline.close_pipeline()
+    return failed
+
+
+# Collects everything parse_product needs in a single WebDriver round trip
+PRODUCT_EXTRACTION_SCRIPT = """
+    const text = (selector) => {
+        const element = document.querySelector(selector);
+        return element ? element.innerText.trim() : "";
+    };
+
+    const images = [];
+    for (const image of document.querySelectorAll("li img")) {
+        const link = image.src || "";
+        if (link.startsWith("https://m.media-amazon.com/images/I/") && !images.includes(link)) {
+            images.push(link);
+        }
+    }
+
+    const features = [];
+    for (const bullet of document.querySelectorAll("li.a-spacing-mini")) {
+        const span = bullet.querySelector("span");
+        const feature = span ? span.innerText.trim() : "";
+        if (feature && !features.includes(feature)) {
+            features.push(feature);
+        }
+    }
+
+    return JSON.stringify({
+        title: text("#productTitle"),
+        images: images,
+        features: features,
+        price_symbol: text("span.a-price-symbol"),
+        price_whole: text("span.a-price-whole"),
+        price_fraction: text("span.a-price-fraction"),
+    });
+"""
+
+
+def parse_product(product_object, location="us", retries=3, image_downloader=None, change_index=None, driver_pool=None, archive=None, budget=None, asin_index=None, data_pipeline=None):
+
+
+    search_url = product_object["url"]
+    # Rows from a multi-region search carry the marketplace they were found in
+    location = product_object.get("location") or location
+
+    tries = 0
+    success = False
+
+
+    asin = extract_asin(search_url) or product_object.get("name")
+    # Every URL variant of a product (ref= tags, sponsored redirects) is fetched as /dp/ASIN
+    product_url = canonical_url(search_url) or search_url
+
+    title = title_slug(search_url) or asin
+
+    logger.debug(f"Looking up {title} ({location})")
+
+    product_pipeline = data_pipeline or DataPipeline(csv_filename=f"{title}.csv", change_index=change_index)
+
+    labels = {"location": location}
+
+
+    with tracer.span("parse_product", asin=asin, location=location) as root_span:
+        with tracer.span("build_proxy_url"):
+            proxy_url = get_scrapeops_url(product_url, location=location)
+
+        out_of_budget = False
+        while tries <= retries and not success and not shutdown.stopping:
+            # Every attempt costs a proxy credit
+            if budget is not None and not budget.spend():
+                out_of_budget = True
+                break
+            with tracer.span("attempt", attempt=tries + 1) as attempt_span:
+                error = None
+                driver = None
+                try:
+                    with tracer.span("driver_launch"), metrics.timer("stage_seconds", stage="product_driver_launch", **labels):
+                        driver = driver_pool.acquire(location) if driver_pool else create_driver(location)
+                    metrics.inc("proxy_credits_total", **labels)
+                    with tracer.span("navigate", url=product_url), metrics.timer("stage_seconds", stage="product_navigate", **labels):
+                        driver.get(proxy_url)
+                    if archive is not None:
+                        with tracer.span("archive"):
+                            archive.write(product_url, driver.page_source, kind="product", location=location)
+
+                    with tracer.span("extract") as extract_span, metrics.timer("stage_seconds", stage="product_extract", **labels):
+                        page = json.loads(driver.execute_script(PRODUCT_EXTRACTION_SCRIPT))
+
+                        images_to_save = page["images"]
+                        features = page["features"]
+                        price_symbol = page["price_symbol"]
+                        whole_number = page["price_whole"].replace(",", "").replace(".", "")
+                        decimal = page["price_fraction"]
+                        if not (price_symbol and whole_number and decimal):
+                            raise Exception("Price not found on product page")
+
+                        price = float(f"{whole_number}.{decimal}")
+                        extract_span.set_attribute("images", len(images_to_save))
+                        extract_span.set_attribute("features", len(features))
+
+            
+                    if len(images_to_save) > 0 and len(features) > 0:
+                        item_data = ProductPageData(
+                            name=asin,
+                            title=title,
+                            url=product_url,
+                            pricing_unit=price_symbol,
+                            price=price,
+                            location=location,
+                            page_title=page["title"],
+                            features=features,
+                            images=images_to_save
+                        )
+
+                        with tracer.span("pipeline_enqueue"):
+                            product_pipeline.add_data(item_data)
+                            if data_pipeline is None:
+                                product_pipeline.close_pipeline()
+                        if image_downloader:
+                            image_downloader.submit(item_data.name, images_to_save)
+                        if asin_index is not None:
+                            asin_index.mark_scraped(f"{location}:{asin}")
+                        metrics.inc("products_succeeded_total", **labels)
+                        success = True
+                    else:
+                        raise Exception("No images or feature bullets found on product page")
+                except Exception as e:
+                    error = e
+                    attempt_span.record_exception(e)
+                    failure_recorder.capture(driver, f"product-{asin}-{location}", tries + 1, e)
+                    logger.warning(f"Failed to parse item: {e}, tries left: {retries-tries}")
+                    metrics.inc("product_retries_total", **labels)
+                    tries += 1
+                finally:
+                    release_driver(driver, driver_pool, error)
+        root_span.set_attribute("attempts", tries + int(success))
+        root_span.set_attribute("success", success)
+        if out_of_budget:
+            root_span.set_attribute("budget_exhausted", True)
+            metrics.inc("products_skipped_total", reason="budget")
+        elif not success and shutdown.stopping:
+            metrics.inc("products_skipped_total", reason="shutdown")
+        elif not success:
+            metrics.inc("products_failed_total", **labels)
+    return None
+
+
+def threaded_item_lookup(csv_filename, location="us", retries=3, threads=3, image_downloader=None, change_index=None, driver_pool=None, archive=None, priority=None, budget=None, asin_index=None, rescrape_after=None):
+    """Look up the product page of every row in ``csv_filename``.
+
+    Rows are streamed in file order, or with a ``priority`` (see
+    ``priority.PRIORITIES``) looked up best first. Either way a product is
+    only looked up once per marketplace, however many URLs it was listed
+    under. A ``LookupBudget`` stops the run once its time or credits are
+    spent. With an ``asin_index``, products already scraped in this run
+    (or within ``rescrape_after`` seconds) are skipped. Every product is
+    written in batches to ``{stem}_products.csv`` and its child tables.
+    """
+    stem, extension = os.path.splitext(csv_filename)
+    # A rotated search output is read back from its finished shards
+    threaded_row_lookup(read_rows(csv_filename), location, retries, threads, image_downloader, change_index, driver_pool, archive, priority, budget, asin_index, rescrape_after, products_filename=f"{stem}_products{extension or '.csv'}")
+
+
+def threaded_row_lookup(rows, location="us", retries=3, threads=3, image_downloader=None, change_index=None, driver_pool=None, archive=None, priority=None, budget=None, asin_index=None, rescrape_after=None, products_filename="products.csv"):
+    """``threaded_item_lookup`` for rows that are not in a CSV, such as a list of ASINs."""
+    if priority is not None:
+        rows = prioritized(rows, priority, budget, location)
+    else:
+        rows = unique_lookups(rows, location)
+        if budget is not None:
+            rows = within_budget(rows, budget)
+    if asin_index is not None:
+        rows = unscraped_lookups(rows, asin_index, location, rescrape_after)
+    product_pipeline = DataPipeline(csv_filename=products_filename, change_index=change_index)
+    tasks = ((row, location, retries, image_downloader, change_index, driver_pool, archive, budget, asin_index, product_pipeline) for row in rows)
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            submit_bounded(executor, parse_product, tasks, max_pending=threads * 2)
+    finally:
+        product_pipeline.close_pipeline()
+
+
+
+class CrawlEngine:
+    """The browsers, parse processes and stores searches and lookups run on.
+
+    Everything is opened once and reused until ``close``, so a long-lived
+    process pays the Selenium, Chrome and storage start-up only once.
+    Storage backends are only imported when the matching option is enabled.
+    With ``parse_workers`` search pages are parsed in that many processes
+    while ``max_threads`` browsers per location only fetch. With
+    ``archive_dir`` every fetched page is also kept in a WARC archive there.
+    Product pages are looked up in file order (or ``priority`` order, which
+    reads all rows first) until ``budget_seconds`` or ``budget_credits`` (proxy requests for product
+    pages) of a ``budget()`` run out. ``asin_index_file`` keeps one product
+    from being stored under several keywords or looked up twice (or again
+    within ``rescrape_after`` seconds on later runs); ``run_started`` makes
+    this run continue an earlier, interrupted one. ``rotate_rows``,
+    ``rotate_bytes`` and ``rotate_seconds`` split each keyword's search
+    output into finalized shards listed in ``{keyword}.manifest.json``.
+    With ``durable`` each search result is logged to ``{keyword}.csv.wal``
+    before it is accepted, with fsyncs shared across threads every
+    ``commit_window`` seconds, and results a crashed run never wrote are
+    recovered on the next one. Browsers are recycled after
+    ``driver_max_pages`` pages or once their process tree uses more than
+    ``driver_max_rss_mb`` (0 disables either limit).
+    """
+
+    def __init__(
+        self,
+        max_threads=3,
+        retries=4,
+        locations=("us",),
+        metrics_file="metrics.prom",
+        metrics_interval=30,
+        trace_file="spans.jsonl",
+        image_dir=None,
+        price_history_file="price_history.log",
+        asin_index_file="asins.sqlite",
+        rescrape_after=None,
+        rotate_rows=None,
+        rotate_bytes=None,
+        rotate_seconds=None,
+        durable=False,
+        commit_window=0.002,
+        change_only=False,
+        reuse_drivers=None,
+        driver_max_pages=200,
+        driver_max_rss_mb=1500,
+        parse_workers=0,
+        archive_dir=None,
+        priority=None,
+        budget_seconds=None,
+        budget_credits=None,
+        failure_dir="failures",
+        failure_max_mb=200,
+        failure_screenshots=True,
+        run_started=None,
+    ):
+        from .drivers import DriverPool
+
+        self.max_threads = max_threads
+        self.retries = retries
+        self.locations = list(locations)
+        self.metrics_file = metrics_file
+        self.image_dir = image_dir
+        self.rescrape_after = rescrape_after
+        self.rotation = {"rotate_rows": rotate_rows, "rotate_bytes": rotate_bytes, "rotate_seconds": rotate_seconds}
+        self.durable = durable
+        self.commit_window = commit_window
+        self.parse_workers = parse_workers
+        self.priority = priority
+        self.budget_seconds = budget_seconds
+        self.budget_credits = budget_credits
+        self.run_started = time.time() if run_started is None else run_started
+        self.lock = threading.Lock()
+        if reuse_drivers is None:
+            reuse_drivers = config.PROXY_MODE == "port"
+
+        if metrics_file:
+            metrics.start_periodic_export(metrics_file, interval=metrics_interval)
+        if trace_file:
+            tracer.configure(trace_file)
+        failure_recorder.configure(failure_dir, max_bytes=failure_max_mb * 1024 * 1024, screenshots=failure_screenshots)
+
+        self.price_history = None
+        if price_history_file:
+            from .price_history import PriceHistoryStore
+
+            self.price_history = PriceHistoryStore(price_history_file)
+        self.asin_index = None
+        if asin_index_file:
+            from .asin_index import AsinIndex
+
+            self.asin_index = AsinIndex(asin_index_file, run_started=self.run_started)
+        self.archive = None
+        if archive_dir:
+            from .archive import PageArchive
+
+            self.archive = PageArchive(archive_dir)
+        self.search_index = self.product_index = None
+        if change_only:
+            from .change_index import ContentHashIndex
+
+            self.search_index = ContentHashIndex("search.hashes")
+            self.product_index = ContentHashIndex("products.hashes")
+        self.driver_pool = DriverPool(create_driver, size=max_threads * len(self.locations), watchdog=DRIVER_WATCHDOG) if reuse_drivers else None
+        DRIVER_WATCHDOG.configure(max_pages=driver_max_pages, max_rss_mb=driver_max_rss_mb)
+        DRIVER_WATCHDOG.start()
+        # Started by the first search or lookup that needs them
+        self.parse_executor = None
+        self.image_downloader = None
+
+    def parsers(self):
+        with self.lock:
+            if self.parse_executor is None and self.parse_workers:
+                self.parse_executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+            return self.parse_executor
+
+    def downloader(self):
+        with self.lock:
+            if self.image_downloader is None and self.image_dir:
+                from .images import ImageDownloader
+
+                self.image_downloader = ImageDownloader(output_dir=self.image_dir, location=self.locations[0])
+            return self.image_downloader
+
+    def budget(self):
+        """A fresh ``LookupBudget`` for one batch of lookups, or None without budget limits."""
+        if self.budget_seconds or self.budget_credits:
+            return LookupBudget(self.budget_seconds, self.budget_credits)
+        return None
+
+    def warm(self, locations=None):
+        """Start the pooled drivers for ``locations`` before the first page needs them."""
+        if self.driver_pool is None:
+            return
+        locations = list(locations or self.locations)
+        for location in locations:
+            self.driver_pool.warm(location, max(1, self.driver_pool.size // len(locations)))
+
+    def search(self, product, pages=3, locations=None, data_pipeline=None, complete=False):
+        """Search ``product`` in every location into ``{product}.csv`` (or ``data_pipeline``); returns the CSV name.
+
+        Pages that run out of retries are logged and skipped, or with
+        ``complete`` make the search raise once the other pages are done.
+        """
+        locations = list(locations or self.locations)
+        search_pipeline = data_pipeline or DataPipeline(
+            csv_filename=f"{product}.csv",
+            price_history=self.price_history,
+            change_index=self.search_index,
+            asin_index=self.asin_index,
+            wal=WriteAheadLog(f"{product}.csv.wal", commit_window=self.commit_window) if self.durable else None,
+            **self.rotation
+        )
+        parse_executor = self.parsers()
+        try:
+            if len(locations) > 1:
+                failed = multi_region_search(product, pages, locations, max_workers=self.max_threads, retries=self.retries, driver_pool=self.driver_pool, parse_executor=parse_executor, archive=self.archive, data_pipeline=search_pipeline)
+            elif parse_executor is not None:
+                failed = staged_search(product, pages, fetch_workers=self.max_threads, retries=self.retries, location=locations[0], driver_pool=self.driver_pool, parse_executor=parse_executor, archive=self.archive, data_pipeline=search_pipeline)
+            else:
+                failed = threaded_search(product, pages, max_workers=self.max_threads, retries=self.retries, location=locations[0], driver_pool=self.driver_pool, archive=self.archive, data_pipeline=search_pipeline)
+        finally:
+            if data_pipeline is None:
+                search_pipeline.close_pipeline()
+        if failed:
+            if len(locations) == 1:
+                failed = [(locations[0], page) for page in failed]
+            pages_failed = ", ".join(f"{location} p{page}" for location, page in failed)
+            logger.warning(f"Search for {product} is missing pages: {pages_failed}")
+            if complete:
+                raise RuntimeError(f"Search for {product} failed on {len(failed)} of {pages * len(locations)} pages")
+        return search_pipeline.csv_filename
+
+    def lookup(self, csv_filename, location=None, budget=None):
+        """Look up the product page of every row in ``csv_filename``."""
+        threaded_item_lookup(csv_filename, location=location or self.locations[0], threads=self.max_threads, retries=self.retries, image_downloader=self.downloader(), change_index=self.product_index, driver_pool=self.driver_pool, archive=self.archive, priority=self.priority, budget=budget, asin_index=self.asin_index, rescrape_after=self.rescrape_after)
+
+    def lookup_rows(self, rows, location=None, budget=None, products_filename="products.csv"):
+        """Look up the product page of every row, e.g. ``{"url": ..., "location": ...}`` dicts, into ``products_filename``."""
+        threaded_row_lookup(rows, location=location or self.locations[0], threads=self.max_threads, retries=self.retries, image_downloader=self.downloader(), change_index=self.product_index, driver_pool=self.driver_pool, archive=self.archive, priority=self.priority, budget=budget, asin_index=self.asin_index, rescrape_after=self.rescrape_after, products_filename=products_filename)
+
+    def close(self):
+        if self.parse_executor is not None:
+            self.parse_executor.shutdown(cancel_futures=True)
+        if self.image_downloader:
+            self.image_downloader.close()
+        if self.price_history:
+            self.price_history.close()
+        if self.archive:
+            self.archive.close()
+        if self.asin_index:
+            self.asin_index.close()
+        if self.search_index is not None:
+            self.search_index.save()
+            self.product_index.save()
+        if self.driver_pool:
+            self.driver_pool.close()
+        close_proxy_forwarders()
+        DRIVER_WATCHDOG.stop()
+        failure_recorder.close()
+
+        if self.metrics_file:
+            metrics.stop_periodic_export()
+            metrics.export(self.metrics_file)
+        tracer.flush()
+
+
+def crawl(products, pages=3, details=True, csv_files=(), drain_seconds=30, checkpoint_file="crawl.checkpoint.json", run_started=None, **options):
+    """Search every keyword in ``products``, then look up each result's product page.
+
+    ``csv_files`` are earlier search results to look up as well. ``options``
+    configure the ``CrawlEngine`` it all runs on.
+
+    SIGTERM or SIGINT stops the crawl gracefully: no new pages are started,
+    in-flight ones get ``drain_seconds`` to finish, every pipeline is
+    flushed, the drivers are quit and the unfinished keywords and lookups
+    are saved to ``checkpoint_file``. A resumed crawl passes the checkpoint's
+    ``run_started`` so products the interrupted run already stored or looked
+    up are skipped.
+    """
+    engine = CrawlEngine(run_started=run_started, **options)
+    shutdown.install(drain_seconds)
+    shutdown.at_deadline(DRIVER_WATCHDOG.kill_all)
+
+    aggregate_products = list(csv_files)
+    remaining_products = list(products)
+    looked_up = []
+    try:
+        for product in products:
+            if shutdown.stopping:
+                break
+            csv_filename = engine.search(product, pages)
+            # A keyword interrupted part way is searched again on resume
+            if shutdown.stopping:
+                break
+            remaining_products.remove(product)
+            if details:
+                aggregate_products.append(csv_filename)
+
+        budget = engine.budget()
+        for product in aggregate_products:
+            if shutdown.stopping:
+                break
+            engine.lookup(product, budget=budget)
+            if not shutdown.stopping:
+                looked_up.append(product)
+    finally:
+        engine.close()
+        if checkpoint_file:
+            if shutdown.stopping:
+                write_checkpoint(checkpoint_file, {
+                    "run_started": engine.run_started,
+                    "products": remaining_products,
+                    "pages": pages,
+                    "details": details,
+                    "csv_files": [product for product in aggregate_products if product not in looked_up],
+                })
+            else:
+                remove_checkpoint(checkpoint_file)
+        shutdown.uninstall()
+    return aggregate_products
@@ -0,0 +1,265 @@
+"""Local HTTP API for on-demand searches and product lookups.
+
+``python -m amazon_scraper serve`` keeps a warm ``CrawlEngine`` and answers
+
+* ``POST /search`` with a JSON body ``{"keyword": "phone", "pages": 1,
+  "location": "us"}``, streaming each search result as it is parsed, and
+* ``GET /product/<ASIN>?location=us`` with that product page's record.
+
+Records are sent as NDJSON, or as server-sent events when the request asks
+for ``text/event-stream`` (or ``?format=sse``). Complete answers (not those
+of a failed or interrupted scrape) are cached for ``cache_ttl`` seconds and
+served from the cache while fresh. Nothing is written to CSV.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .metrics import metrics
+from .models import record_key
+from .shutdown import shutdown
+from .urls import BARE_ASIN, canonical_url
+
+logger = logging.getLogger(__name__)
+
+
+class TtlCache:
+    """Keeps up to ``max_entries`` values, each for ``ttl`` seconds after it was stored."""
+
+    def __init__(self, ttl=600, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[0] >= self.ttl:
+                self.entries.pop(key, None)
+                metrics.inc("api_cache_misses_total")
+                return None
+            self.entries.move_to_end(key)
+        metrics.inc("api_cache_hits_total")
+        return entry[1]
+
+    def put(self, key, value):
+        if not self.ttl:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class StreamingPipeline:
+    """Stands in for a DataPipeline and hands every new record to the response as soon as it is added."""
+
+    csv_filename = None
+
+    def __init__(self):
+        # Set by ``produce`` once the producer returned without raising
+        self.succeeded = False
+        self.records = queue.Queue()
+        self.names_seen = set()
+        self.lock = threading.Lock()
+
+    def add_data(self, scraped_data):
+        key = record_key(scraped_data)
+        with self.lock:
+            if key in self.names_seen:
+                return
+            self.names_seen.add(key)
+        self.records.put(scraped_data)
+
+    def add_many(self, records):
+        for record in records:
+            self.add_data(record)
+
+    def close_pipeline(self):
+        self.records.put(None)
+
+    def __iter__(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                return
+            yield record
+
+
+def produce(target, *args, **kwargs):
+    """Run ``target(*args, data_pipeline=pipeline, **kwargs)`` in a thread and return the pipeline to read from."""
+    pipeline = StreamingPipeline()
+
+    def run():
+        try:
+            target(*args, data_pipeline=pipeline, **kwargs)
+            pipeline.succeeded = True
+        except Exception as e:
+            logger.error(f"{target.__name__} failed: {e}")
+        finally:
+            pipeline.close_pipeline()
+
+    threading.Thread(target=run, name=f"api-{target.__name__}", daemon=True).start()
+    return pipeline
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "amazon-scraper"
+
+    @property
+    def engine(self):
+        return self.server.engine
+
+    @property
+    def cache(self):
+        return self.server.cache
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def wants_events(self, query):
+        return query.get("format", [""])[0] == "sse" or "text/event-stream" in self.headers.get("Accept", "")
+
+    def stream(self, records, events, cached=False):
+        """Write each record as it arrives and return them all, even if the client went away."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if events else "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Cache", "hit" if cached else "miss")
+        self.end_headers()
+        sent = []
+        connected = True
+        for record in records:
+            sent.append(record)
+            if not connected:
+                continue
+            line = json.dumps(record)
+            try:
+                self.wfile.write((f"event: record\ndata: {line}\n\n" if events else f"{line}\n").encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Keep draining so the finished answer still reaches the cache
+                connected = False
+        if connected and events:
+            try:
+                self.wfile.write(f"event: end\ndata: {json.dumps({'count': len(sent), 'cached': cached})}\n\n".encode("utf-8"))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        return sent
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/search":
+            self.send_json(404, {"error": f"no such endpoint: {url.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            keyword = body["keyword"].strip()
+            pages = int(body.get("pages", 1))
+            location = body.get("location") or self.engine.locations[0]
+            if not keyword or pages < 1:
+                raise ValueError("keyword must be non-empty and pages at least 1")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": f"expected {{\"keyword\": str, \"pages\": int, \"location\": str}}: {e}"})
+            return
+        events = self.wants_events(parse_qs(url.query))
+        key = ("search", keyword, pages, location)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stream(cached, events, cached=True)
+            return
+        if shutdown.stopping:
+            self.send_json(503, {"error": "shutting down"})
+            return
+        with metrics.timer("api_seconds", endpoint="search"):
+            pipeline = produce(self.engine.search, keyword, pages, [location], complete=True)
+            records = self.stream((asdict(record) for record in pipeline), events)
+        # A search that lost pages or was interrupted is not a complete answer
+        if pipeline.succeeded and not shutdown.stopping:
+            self.cache.put(key, records)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "product":
+            self.send_json(404, {"error": f"no such endpoint: {url.path}"})
+            return
+        asin = parts[1].upper()
+        if not BARE_ASIN.fullmatch(asin):
+            self.send_json(400, {"error": f"not an ASIN: {parts[1]}"})
+            return
+        query = parse_qs(url.query)
+        location = query.get("location", [self.engine.locations[0]])[0]
+        events = self.wants_events(query)
+
+        key = ("product", asin, location)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stream(cached, events, cached=True)
+            return
+        if shutdown.stopping:
+            self.send_json(503, {"error": "shutting down"})
+            return
+        from .scraper import parse_product
+
+        row = {"name": asin, "url": canonical_url(asin), "location": location}
+        engine = self.engine
+        with metrics.timer("api_seconds", endpoint="product"):
+            pipeline = produce(parse_product, row, location, retries=engine.retries, driver_pool=engine.driver_pool, archive=engine.archive)
+            # A product is a single record, so wait for it and answer with a real status code
+            records = [asdict(record) for record in pipeline]
+        if not records or not pipeline.succeeded:
+            self.send_json(502, {"error": f"could not scrape {asin} ({location})"})
+            return
+        self.cache.put(key, records)
+        self.stream(records, events)
+
+
+class ApiServer(ThreadingHTTPServer):
+    # Let in-flight responses finish when the server closes
+    daemon_threads = False
+
+    def __init__(self, address, engine, cache):
+        super().__init__(address, ApiHandler)
+        self.engine = engine
+        self.cache = cache
+
+
+def serve_api(engine, host="127.0.0.1", port=8080, cache_ttl=600, drain_seconds=30):
+    """Answer API requests on ``engine`` until SIGTERM/SIGINT, then close it."""
+    from .scraper import DRIVER_WATCHDOG
+
+    shutdown.install(drain_seconds)
+    shutdown.at_deadline(DRIVER_WATCHDOG.kill_all)
+    engine.warm()
+    server = ApiServer((host, port), engine, TtlCache(cache_ttl))
+
+    def stop_on_shutdown():
+        shutdown.requested.wait()
+        server.shutdown()
+
+    threading.Thread(target=stop_on_shutdown, name="api-shutdown", daemon=True).start()
+    logger.info(f"Serving on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    finally:
+        # Waits for the requests still being answered
+        server.server_close()
+        engine.close()
+        shutdown.uninstall()
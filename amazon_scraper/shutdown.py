@@ -0,0 +1,134 @@
+"""Graceful shutdown on SIGTERM/SIGINT and the crawl resume checkpoint.
+
+A signal only sets ``shutdown.stopping``: submit loops stop taking new
+tasks and retry loops stop retrying, so pages already in a browser get
+``drain_seconds`` to finish. When the deadline passes the ``at_deadline``
+callbacks run (``crawl`` kills every tracked Chrome process tree there, so
+calls still waiting on a browser fail fast) and ``crawl`` goes on to flush
+its pipelines, quit the drivers and write a checkpoint that ``resume``
+picks up. A second signal skips the rest of the drain.
+"""
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class ShutdownCoordinator:
+
+    def __init__(self):
+        self.requested = threading.Event()
+        self.drain_seconds = 30
+        self.deadline = None
+        self.expired = False
+        self.timer = None
+        self.callbacks = []
+        self.previous_handlers = {}
+        self.lock = threading.Lock()
+
+    @property
+    def stopping(self):
+        return self.requested.is_set()
+
+    def install(self, drain_seconds=30):
+        """Handle SIGTERM and SIGINT until ``uninstall``; a no-op outside the main thread."""
+        self.drain_seconds = drain_seconds
+        if threading.current_thread() is not threading.main_thread():
+            return self
+        for signum in SHUTDOWN_SIGNALS:
+            self.previous_handlers[signum] = signal.signal(signum, self.handle_signal)
+        return self
+
+    def uninstall(self):
+        """Restore the signal handlers and forget this shutdown, so the next ``install`` starts clean."""
+        for signum, handler in self.previous_handlers.items():
+            signal.signal(signum, handler)
+        self.previous_handlers = {}
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = None
+            self.requested.clear()
+            self.deadline = None
+            self.expired = False
+            self.callbacks = []
+
+    def handle_signal(self, signum, frame):
+        name = signal.Signals(signum).name
+        if not self.stopping:
+            self.request(name)
+            return
+        logger.warning(f"{name} received again, not waiting for in-flight pages")
+        # Killing browsers can take a while, so keep it out of the signal handler
+        threading.Thread(target=self.expire, name="shutdown", daemon=True).start()
+
+    def request(self, reason="requested"):
+        """Start shutting down: no new tasks, and ``drain_seconds`` for the running ones."""
+        with self.lock:
+            if self.stopping:
+                return
+            self.deadline = time.monotonic() + self.drain_seconds
+            self.requested.set()
+            self.timer = threading.Timer(self.drain_seconds, self.expire)
+            self.timer.daemon = True
+            self.timer.start()
+        logger.warning(f"Shutting down ({reason}): waiting up to {self.drain_seconds}s for in-flight pages")
+        metrics.inc("shutdowns_total", reason=reason)
+
+    def remaining(self):
+        """Seconds left to drain, or None if no shutdown was requested."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def at_deadline(self, callback):
+        with self.lock:
+            if callback not in self.callbacks:
+                self.callbacks.append(callback)
+
+    def expire(self):
+        with self.lock:
+            if self.expired:
+                return
+            self.expired = True
+            if self.timer is not None:
+                self.timer.cancel()
+            callbacks = list(self.callbacks)
+        logger.warning("Drain deadline passed, stopping in-flight browsers")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Shutdown callback failed: {e}")
+
+
+def write_checkpoint(path, state):
+    with open(f"{path}.tmp", "w", encoding="utf-8") as checkpoint_file:
+        json.dump(state, checkpoint_file, indent=2)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(f"{path}.tmp", path)
+    logger.info(f"Wrote resume checkpoint {path}")
+
+
+def read_checkpoint(path):
+    with open(path, encoding="utf-8") as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def remove_checkpoint(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+shutdown = ShutdownCoordinator()
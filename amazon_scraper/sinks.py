@@ -0,0 +1,237 @@
+"""CSV output sinks that keep their file open and optionally rotate into shards.
+
+A rotating sink writes ``phone-00001.csv.part`` and, once the shard reaches
+its row, byte or age limit, fsyncs it, renames it to ``phone-00001.csv`` and
+atomically rewrites ``phone.manifest.json``. Only finished shards are ever
+listed in the manifest, so loaders can pick them up while the crawl is still
+writing the next one. Shards a crashed run left behind (a ``.part`` file, or
+a renamed shard the manifest never got) are finalized into the manifest
+when the next sink for the same path starts, and new shards are always
+numbered past them.
+"""
+import csv
+import json
+import logging
+import os
+import re
+import time
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITE_BUFFER_BYTES = 256 * 1024
+
+
+def manifest_path(path):
+    stem, _ = os.path.splitext(path)
+    return f"{stem}.manifest.json"
+
+
+def read_manifest(path):
+    try:
+        with open(manifest_path(path), encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {"shards": []}
+
+
+def finished_files(path):
+    """The files holding ``path``'s rows: its finished shards if it was rotated, else ``path`` itself."""
+    shards = read_manifest(path)["shards"]
+    if shards:
+        directory = os.path.dirname(path)
+        return [os.path.join(directory, shard["file"]) for shard in shards]
+    return [path] if os.path.isfile(path) else []
+
+
+def read_rows(path):
+    """Stream rows as dicts from every finished file of ``path``."""
+    for filename in finished_files(path):
+        with open(filename, newline='', encoding='utf-8') as csvfile:
+            yield from csv.DictReader(csvfile)
+
+
+class CsvSink:
+    """Appends rows to one CSV, writing the header only when the file starts empty."""
+
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        self.file = None
+        self.writer = None
+
+    def open(self):
+        self.file = open(self.path, mode='a', newline='', encoding='utf-8', buffering=WRITE_BUFFER_BYTES)
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(self.header)
+
+    def write_rows(self, rows):
+        if self.file is None:
+            self.open()
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def sync(self):
+        """Force the rows written so far to disk."""
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class RotatingCsvSink(CsvSink):
+    """Writes numbered shards, rotating after ``max_rows`` rows, ``max_bytes`` bytes or ``interval`` seconds."""
+
+    def __init__(self, path, header, max_rows=None, max_bytes=None, interval=None):
+        super().__init__(path, header)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.manifest = read_manifest(path)
+        self.shard_path = None
+        self.rows = 0
+        self.opened = None
+        self.shard_number = self.recover()
+
+    def shard_name(self, number):
+        stem, extension = os.path.splitext(os.path.basename(self.path))
+        return f"{stem}-{number:05d}{extension or '.csv'}"
+
+    def recover(self):
+        """Finalize the shards a crashed run left out of the manifest; returns the highest shard number in use."""
+        directory = os.path.dirname(self.path)
+        stem, extension = os.path.splitext(os.path.basename(self.path))
+        pattern = re.compile(re.escape(stem) + r"-(\d{5})" + re.escape(extension or ".csv") + r"(\.part)?$")
+        listed = {shard["file"] for shard in self.manifest["shards"]}
+        highest = 0
+        leftovers = []
+        for name in os.listdir(directory or "."):
+            match = pattern.match(name)
+            if not match:
+                continue
+            number = int(match.group(1))
+            highest = max(highest, number)
+            shard_name = self.shard_name(number)
+            if shard_name not in listed:
+                leftovers.append((number, os.path.join(directory, name), os.path.join(directory, shard_name)))
+        for shard in self.manifest["shards"]:
+            match = pattern.match(shard["file"])
+            if match:
+                highest = max(highest, int(match.group(1)))
+
+        for _, leftover, shard_path in sorted(leftovers):
+            rows, size = self.repair(leftover)
+            if not rows:
+                os.remove(leftover)
+                continue
+            if leftover != shard_path:
+                os.replace(leftover, shard_path)
+            modified = os.path.getmtime(shard_path)
+            self.manifest["shards"].append({
+                "file": os.path.basename(shard_path),
+                "rows": rows,
+                "bytes": size,
+                "opened": modified,
+                "closed": modified,
+                "recovered": True,
+            })
+            metrics.inc("shards_recovered_total")
+            logger.warning(f"Recovered {rows} rows an earlier run left in {leftover}")
+        if leftovers:
+            self.write_manifest()
+        return highest
+
+    def repair(self, path):
+        """Cut a torn last row off a leftover shard and fsync it; returns ``(rows, bytes)``."""
+        with open(path, "r+b") as shard_file:
+            content = shard_file.read()
+            # csv.writer ends every row with \r\n, so anything after the last one is a torn write
+            end = content.rfind(b"\r\n") + 2 if b"\r\n" in content else 0
+            if end < len(content):
+                shard_file.truncate(end)
+            shard_file.flush()
+            os.fsync(shard_file.fileno())
+        with open(path, newline='', encoding='utf-8') as shard_file:
+            rows = max(sum(1 for _ in csv.reader(shard_file)) - 1, 0)
+        return rows, end
+
+    def open(self):
+        self.shard_number += 1
+        directory = os.path.dirname(self.path)
+        self.shard_path = os.path.join(directory, self.shard_name(self.shard_number))
+        # Exclusive, so an existing shard is never truncated
+        self.file = open(f"{self.shard_path}.part", mode='x', newline='', encoding='utf-8', buffering=WRITE_BUFFER_BYTES)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.header)
+        self.rows = 0
+        self.opened = time.time()
+
+    def is_full(self):
+        if self.max_rows and self.rows >= self.max_rows:
+            return True
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            return True
+        return bool(self.interval) and time.time() - self.opened >= self.interval
+
+    def write_rows(self, rows):
+        rows = list(rows)
+        while rows:
+            if self.file is None:
+                self.open()
+            # Split the batch so row-limited shards come out exactly max_rows long
+            room = self.max_rows - self.rows if self.max_rows else len(rows)
+            chunk, rows = rows[:room], rows[room:]
+            self.writer.writerows(chunk)
+            self.rows += len(chunk)
+            self.file.flush()
+            if self.is_full():
+                self.finalize()
+
+    def finalize(self):
+        """Close the current shard, publish it under its final name and record it in the manifest."""
+        size = self.file.tell()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+        os.replace(f"{self.shard_path}.part", self.shard_path)
+
+        self.manifest["shards"].append({
+            "file": os.path.basename(self.shard_path),
+            "rows": self.rows,
+            "bytes": size,
+            "opened": self.opened,
+            "closed": time.time(),
+        })
+        self.write_manifest()
+        metrics.inc("shards_finalized_total")
+        logger.info(f"Finalized {self.shard_path} ({self.rows} rows)")
+
+    def write_manifest(self):
+        path = manifest_path(self.path)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=2)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def close(self):
+        if self.file is not None:
+            if self.rows:
+                self.finalize()
+            else:
+                self.file.close()
+                self.file = None
+                os.remove(f"{self.shard_path}.part")
+                self.shard_number -= 1
+
+
+def open_sink(path, header, max_rows=None, max_bytes=None, interval=None):
+    if max_rows or max_bytes or interval:
+        return RotatingCsvSink(path, header, max_rows, max_bytes, interval)
+    return CsvSink(path, header)
@@ -0,0 +1,149 @@
+"""Structured trace spans written as OpenTelemetry (OTLP/JSON) span files.
+
+Each line of the span file is an ``ExportTraceServiceRequest`` in the OTLP
+JSON encoding, the same layout the OpenTelemetry Collector file exporter
+produces, so it can be loaded by the collector's ``otlpjsonfile`` receiver or
+inspected with ``jq``.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "amazon-scraper"
+SPAN_KIND_INTERNAL = 1
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = STATUS_OK
+        self.status_message = ""
+        self.events = []
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exception):
+        self.status = STATUS_ERROR
+        self.status_message = str(exception)
+        self.events.append({
+            "timeUnixNano": str(time.time_ns()),
+            "name": "exception",
+            "attributes": [
+                {"key": "exception.type", "value": otlp_value(type(exception).__name__)},
+                {"key": "exception.message", "value": otlp_value(str(exception))},
+            ],
+        })
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        if self.events:
+            span["events"] = self.events
+        return span
+
+
+class Tracer:
+
+    def __init__(self, batch_size=512):
+        self.span_file = None
+        self.batch_size = batch_size
+        self.finished = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def configure(self, span_file):
+        self.flush()
+        self.span_file = span_file
+
+    def current_span(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = self.current_span()
+        trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            stack.pop()
+            self._finish(span)
+
+    def _finish(self, span):
+        if self.span_file is None:
+            return
+        with self._lock:
+            self.finished.append(span)
+            should_flush = len(self.finished) >= self.batch_size
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            spans, self.finished = self.finished, []
+            if not spans or self.span_file is None:
+                return
+            request = {
+                "resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name", "value": otlp_value(SERVICE_NAME)}]},
+                    "scopeSpans": [{
+                        "scope": {"name": __name__},
+                        "spans": [span.to_otlp() for span in spans],
+                    }],
+                }]
+            }
+            try:
+                with open(self.span_file, "a", encoding="utf-8") as span_file:
+                    span_file.write(json.dumps(request, separators=(",", ":")) + "\n")
+            except OSError as e:
+                logger.warning(f"Failed to write spans to {self.span_file}: {e}")
+
+
+tracer = Tracer()
@@ -0,0 +1,86 @@
+"""Amazon product URL canonicalization.
+
+The same product shows up under many URLs: ``/Title/dp/ASIN/ref=sr_1_3?...``,
+``/gp/product/ASIN``, sponsored ``/sspa/click?...&url=%2FTitle%2Fdp%2FASIN...``
+redirects and proxy-rewritten hosts. Everything here reduces them to the
+ASIN and a canonical ``https://<host>/dp/<ASIN>`` URL so a product is only
+fetched once.
+"""
+import re
+from functools import lru_cache
+from urllib.parse import parse_qs, urlsplit
+
+from .metrics import metrics
+
+DEFAULT_HOST = "www.amazon.com"
+
+ASIN_PATH = re.compile(
+    r"/(?:dp|gp/product|gp/aw/d|exec/obidos/ASIN|o/ASIN|product-reviews)/([A-Z0-9]{10})(?=[/?#&]|$)",
+    re.IGNORECASE,
+)
+TITLE_PATH = re.compile(r"/([^/?#]+)/(?:dp|gp/product)/[A-Z0-9]{10}(?=[/?#&]|$)", re.IGNORECASE)
+# Redirect and proxy URLs carry the real target in one of these query parameters
+TARGET_PARAMETERS = ("url", "u")
+AMAZON_HOST = re.compile(r"^(?:www\.|smile\.)?amazon\.[a-z.]+$", re.IGNORECASE)
+BARE_ASIN = re.compile(r"[A-Z0-9]{10}", re.IGNORECASE)
+
+
+def target_url(url):
+    """Unwrap sponsored-click and proxy URLs to the product URL they point at."""
+    for _ in range(3):
+        if ASIN_PATH.search(urlsplit(url).path):
+            return url
+        query = parse_qs(urlsplit(url).query)
+        targets = [query[name][0] for name in TARGET_PARAMETERS if name in query]
+        if not targets:
+            return url
+        url = targets[0]
+    return url
+
+
+@lru_cache(maxsize=65536)
+def extract_asin(url):
+    """The upper-case ASIN in any Amazon product URL shape, or None."""
+    if not url:
+        return None
+    match = ASIN_PATH.search(target_url(url))
+    return match.group(1).upper() if match else None
+
+
+def marketplace_host(url):
+    host = urlsplit(url).hostname or ""
+    return host if AMAZON_HOST.match(host) else DEFAULT_HOST
+
+
+def canonical_url(url, host=None):
+    """``https://<host>/dp/<ASIN>`` for ``url`` (or a bare ASIN), or None without an ASIN."""
+    asin = url.upper() if BARE_ASIN.fullmatch(url or "") else extract_asin(url)
+    if asin is None:
+        return None
+    if host is None:
+        target = target_url(url)
+        host = marketplace_host(target if "://" in target else url)
+    return f"https://{host}/dp/{asin}"
+
+
+def title_slug(url):
+    """The SEO title segment that precedes ``/dp/ASIN``, or None."""
+    match = TITLE_PATH.search(urlsplit(target_url(url or "")).path)
+    return match.group(1) if match else None
+
+
+def lookup_key(row, location="us"):
+    """The key detail lookups are deduplicated on: marketplace plus ASIN."""
+    return (row.get("location") or location, extract_asin(row.get("url")) or row.get("name"))
+
+
+def unique_lookups(rows, location="us", seen=None):
+    """Yield only the first row for each product, before anything is fetched."""
+    seen = set() if seen is None else seen
+    for row in rows:
+        key = lookup_key(row, location)
+        if key in seen:
+            metrics.inc("products_skipped_total", reason="duplicate")
+            continue
+        seen.add(key)
+        yield row
@@ -0,0 +1,166 @@
+"""Write-ahead log for records buffered in a DataPipeline.
+
+Records are appended to ``<path>.NNNNNN`` segment files as length- and
+CRC-prefixed pickles. ``commit`` makes a record durable with group commit:
+the first waiting thread becomes the leader, waits ``commit_window`` for
+others to join, then one fsync covers every record written so far.
+
+The pipeline rotates to a new segment whenever it hands a batch to its
+sink and releases (deletes) that segment once the sink has synced the
+batch, so a crash loses nothing that ``add_data`` (or ``add_many``)
+returned from: leftover segments are replayed on the next start. A single
+writer with many records at once, such as a page of search results, should
+use ``write_many`` so they share one append and one fsync.
+"""
+import logging
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<II")
+
+
+def read_segment(path):
+    """Yield the records of one segment, stopping at the first torn or corrupt record."""
+    with open(path, "rb") as segment_file:
+        data = segment_file.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, checksum = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            logger.warning(f"Ignoring torn record at offset {offset} in {path}")
+            return
+        yield pickle.loads(payload)
+        offset = start + length
+
+
+class WriteAheadLog:
+
+    def __init__(self, path, commit_window=0.002):
+        self.path = path
+        self.commit_window = commit_window
+        self.condition = threading.Condition()
+        self.written = 0
+        self.synced = 0
+        self.syncing = False
+        self.segment_file = None
+        self.segment_path = None
+        self.unsynced_files = []
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        pattern = re.compile(re.escape(os.path.basename(path)) + r"\.(\d{6})$")
+        numbers = sorted(
+            int(match.group(1))
+            for match in map(pattern.match, os.listdir(directory))
+            if match
+        )
+        # Segments left behind by a previous run hold records that never reached the sink
+        self.leftover_segments = [self.segment_name(number) for number in numbers]
+        self.segment_number = numbers[-1] if numbers else 0
+
+    def segment_name(self, number):
+        return f"{self.path}.{number:06d}"
+
+    def recover(self):
+        """Yield the records of a previous run that were logged but never released."""
+        for segment in self.leftover_segments:
+            yield from read_segment(segment)
+
+    def discard_recovered(self):
+        for segment in self.leftover_segments:
+            os.remove(segment)
+        self.leftover_segments = []
+
+    def write(self, record):
+        """Buffer ``record`` in the current segment; returns the sequence number to ``commit``."""
+        return self.write_many([record])
+
+    def write_many(self, records):
+        """Buffer ``records`` in the current segment with one append; returns the sequence number of the last."""
+        chunks = []
+        for record in records:
+            payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            chunks.append(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            chunks.append(payload)
+        with self.condition:
+            if self.segment_file is None:
+                self.segment_number += 1
+                self.segment_path = self.segment_name(self.segment_number)
+                self.segment_file = open(self.segment_path, "ab")
+            self.segment_file.write(b"".join(chunks))
+            self.written += len(chunks) // 2
+            return self.written
+
+    def commit(self, sequence):
+        """Block until record ``sequence`` is on disk, sharing fsyncs between threads."""
+        with self.condition:
+            while self.synced < sequence:
+                if not self.syncing:
+                    self.syncing = True
+                    break
+                self.condition.wait()
+            else:
+                return
+
+        try:
+            # Give concurrent writers a moment to join this group
+            if self.commit_window:
+                time.sleep(self.commit_window)
+            with self.condition:
+                target = self.written
+                rotated, self.unsynced_files = self.unsynced_files, []
+                current = self.segment_file
+                if current is not None:
+                    current.flush()
+            for segment_file in rotated:
+                os.fsync(segment_file.fileno())
+                segment_file.close()
+            if current is not None:
+                os.fsync(current.fileno())
+            with self.condition:
+                metrics.inc("wal_fsyncs_total")
+                metrics.observe("wal_group_commit_records", target - self.synced)
+                self.synced = max(self.synced, target)
+        finally:
+            with self.condition:
+                self.syncing = False
+                self.condition.notify_all()
+
+    def rotate(self):
+        """Close the current segment for new writes; returns its path, or None if nothing was written."""
+        with self.condition:
+            if self.segment_file is None:
+                return None
+            self.segment_file.flush()
+            self.unsynced_files.append(self.segment_file)
+            segment = self.segment_path
+            self.segment_file = None
+            self.segment_path = None
+            return segment
+
+    def release(self, segment):
+        """Drop a segment whose records the sink has made durable."""
+        try:
+            os.remove(segment)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        segment = self.rotate()
+        with self.condition:
+            files, self.unsynced_files = self.unsynced_files, []
+        for segment_file in files:
+            os.fsync(segment_file.fileno())
+            segment_file.close()
+        return segment
@@ -0,0 +1,268 @@
+"""Throughput benchmark for the amazon_scraper engine against local fixtures.
+
+Starts the stub proxy from ``stub_proxy.py``, points the scraper at it and
+runs ``threaded_search`` followed by ``threaded_item_lookup`` in a scratch
+directory. Reports pages/s, per-card parse time, driver startup time,
+pipeline write throughput and peak RSS.
+
+    python benchmarks/bench_scraper.py --pages 5 --threads 3 --json bench.json
+    python benchmarks/bench_scraper.py --baseline bench.json --tolerance 0.15
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from stub_proxy import StubProxyServer
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# metric name -> True when a higher value is better
+METRICS = {
+    "cli_cold_start_ms": False,
+    "search_pages_per_s": True,
+    "detail_pages_per_s": True,
+    "card_parse_ms_median": False,
+    "card_parse_ms_p95": False,
+    "driver_startup_ms_median": False,
+    "pipeline_rows_per_s": True,
+    "peak_rss_mb": False,
+    "peak_child_rss_mb": False,
+}
+
+
+def load_scraper():
+    sys.path.insert(0, REPO_DIR)
+    from amazon_scraper import config, scraper
+    return config, scraper
+
+
+def bench_cli_cold_start(samples):
+    """Wall time of ``python -m amazon_scraper --help`` in a fresh interpreter."""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "amazon_scraper", "--help"],
+            cwd=REPO_DIR, stdout=subprocess.DEVNULL, check=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss / divisor
+
+
+def make_timing_pipeline(scraper):
+    class TimingPipeline(scraper.DataPipeline):
+        """Records the gap between consecutive cards added by the same thread."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.card_times = []
+            self._last_add = threading.local()
+
+        def add_data(self, scraped_data):
+            now = time.perf_counter()
+            last = getattr(self._last_add, "value", None)
+            if last is not None:
+                self.card_times.append(now - last)
+            self._last_add.value = now
+            super().add_data(scraped_data)
+
+        def reset_page(self):
+            self._last_add.value = None
+
+    return TimingPipeline
+
+
+def bench_driver_startup(scraper, samples):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        driver = scraper.create_driver()
+        timings.append(time.perf_counter() - start)
+        scraper.release_driver(driver)
+    return timings
+
+
+def bench_staged_search(scraper, keyword, pages, threads, parse_workers, retries):
+    # Cards are parsed in other processes, so only page throughput is measured
+    start = time.perf_counter()
+    scraper.staged_search(keyword, pages, fetch_workers=threads, parse_workers=parse_workers, retries=retries)
+    return time.perf_counter() - start, []
+
+
+def bench_search(scraper, keyword, pages, threads, retries):
+    TimingPipeline = make_timing_pipeline(scraper)
+    pipeline = TimingPipeline(csv_filename=f"{keyword}.csv")
+    original_search = scraper.search_products
+
+    def timed_search(*args, **kwargs):
+        pipeline.reset_page()
+        return original_search(*args, **kwargs)
+
+    scraper.search_products = timed_search
+    original_pipeline = scraper.DataPipeline
+    scraper.DataPipeline = lambda *args, **kwargs: pipeline
+    try:
+        start = time.perf_counter()
+        scraper.threaded_search(keyword, pages, max_workers=threads, retries=retries)
+        elapsed = time.perf_counter() - start
+    finally:
+        scraper.search_products = original_search
+        scraper.DataPipeline = original_pipeline
+    return elapsed, pipeline.card_times
+
+
+def bench_item_lookup(scraper, csv_filename, threads, retries):
+    with open(csv_filename, newline="", encoding="utf-8") as csvfile:
+        rows = sum(1 for _ in csv.DictReader(csvfile))
+    start = time.perf_counter()
+    scraper.threaded_item_lookup(csv_filename, threads=threads, retries=retries)
+    return rows, time.perf_counter() - start
+
+
+def bench_pipeline(scraper, rows, queue_limit):
+    pipeline = scraper.DataPipeline(csv_filename="pipeline-bench.csv", storage_queue_limit=queue_limit)
+    items = [
+        scraper.ProductData(
+            name=f"B0PIPE{i:06d}",
+            title=f"Benchmark product {i}",
+            url=f"https://www.amazon.com/Benchmark-Product/dp/B0PIPE{i:06d}/",
+            is_ad=bool(i % 7 == 0),
+            pricing_unit="$",
+            price=19.99 + i % 100,
+            real_price=24.99 + i % 100,
+            rating="4.5 out of 5 stars",
+        )
+        for i in range(rows)
+    ]
+    start = time.perf_counter()
+    for item in items:
+        pipeline.add_data(item)
+    pipeline.close_pipeline()
+    return rows / (time.perf_counter() - start)
+
+
+def run(args):
+    config, scraper = load_scraper()
+    server = StubProxyServer(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate
+    ).start()
+    config.PROXY_ENDPOINT = server.endpoint
+
+    results = {"cli_cold_start_ms": statistics.median(bench_cli_cold_start(args.cli_samples)) * 1000}
+    workdir = tempfile.mkdtemp(prefix="amazon-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        startup = bench_driver_startup(scraper, args.driver_samples)
+        results["driver_startup_ms_median"] = statistics.median(startup) * 1000
+
+        if args.parse_workers:
+            elapsed, card_times = bench_staged_search(scraper, args.keyword, args.pages, args.threads, args.parse_workers, args.retries)
+        else:
+            elapsed, card_times = bench_search(scraper, args.keyword, args.pages, args.threads, args.retries)
+        results["search_pages_per_s"] = args.pages / elapsed
+        results["card_parse_ms_median"] = statistics.median(card_times) * 1000 if card_times else 0.0
+        results["card_parse_ms_p95"] = percentile(card_times, 95) * 1000
+
+        if not args.skip_details:
+            rows, elapsed = bench_item_lookup(scraper, f"{args.keyword}.csv", args.threads, args.retries)
+            results["detail_pages_per_s"] = rows / elapsed if rows else 0.0
+
+        results["pipeline_rows_per_s"] = bench_pipeline(scraper, args.pipeline_rows, args.queue_limit)
+    finally:
+        os.chdir(cwd)
+        server.stop()
+
+    stages = scraper.metrics.histograms.get("stage_seconds", {})
+    for key, histogram in stages.items():
+        stage = dict(key)["stage"]
+        results.setdefault("stage_ms_mean", {}).setdefault(stage, [0.0, 0])
+        results["stage_ms_mean"][stage][0] += histogram.sum
+        results["stage_ms_mean"][stage][1] += histogram.count
+    for stage, (total, count) in results.get("stage_ms_mean", {}).items():
+        results["stage_ms_mean"][stage] = round(total / count * 1000, 3)
+
+    results["peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_SELF)
+    results["peak_child_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    results["proxy_requests"] = server.requests_served
+    results["workdir"] = workdir
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, higher_is_better in METRICS.items():
+        if name not in results or not baseline.get(name):
+            continue
+        change = (results[name] - baseline[name]) / baseline[name]
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{name}: {baseline[name]:.2f} -> {results[name]:.2f} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keyword", default="phone")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=3)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--parse-workers", type=int, default=0, help="benchmark staged_search with this many parser processes")
+    parser.add_argument("--driver-samples", type=int, default=3)
+    parser.add_argument("--cli-samples", type=int, default=5)
+    parser.add_argument("--pipeline-rows", type=int, default=20000)
+    parser.add_argument("--queue-limit", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--skip-details", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if results regress against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    results = run(args)
+
+    for name, value in results.items():
+        print(f"{name:28} {value:.2f}" if isinstance(value, float) else f"{name:28} {value}")
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
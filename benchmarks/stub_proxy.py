@@ -0,0 +1,127 @@
+"""Local stand-in for proxy.scrapeops.io used by the benchmark suite.
+
+Serves the captured HTML in ``fixtures/`` for any ``/v1/?api_key=...&url=...``
+request, with optional latency and error injection so the scraper can be
+measured without live Amazon or ScrapeOps credits.
+
+    python benchmarks/stub_proxy.py --port 8900 --latency-ms 250 --error-rate 0.02
+"""
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as fixture:
+        return fixture.read()
+
+
+class StubProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        target = query.get("url", [""])[0]
+
+        if not target:
+            self.send_body(400, "missing url parameter")
+            return
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        server.count_request()
+
+        if random.random() < server.error_rate:
+            self.send_body(500, "<html><body><h1>Proxy error</h1></body></html>")
+            return
+
+        self.send_body(200, server.render(target))
+
+    def send_body(self, status, body):
+        encoded = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class StubProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0, jitter_ms=0, error_rate=0.0):
+        super().__init__((host, port), StubProxyHandler)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.search_html = load_fixture("search.html")
+        self.product_html = load_fixture("product.html")
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def count_request(self):
+        with self._lock:
+            self.requests_served += 1
+
+    def render(self, target):
+        parsed = urlparse(target)
+        if "/dp/" in parsed.path:
+            asin = parsed.path.split("/dp/")[1].split("/")[0]
+            return self.product_html.replace("__ASIN__", asin)
+
+        page = parse_qs(parsed.query).get("page", ["1"])[0]
+        return (
+            self.search_html
+            .replace("__NEXT_PAGE__", str(int(page) + 1))
+            .replace("__PAGE__", page.zfill(2))
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StubProxyServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate)
+    logger.info(f"Stub proxy listening on {server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,20 @@
+from amazon_scraper.price_history import PriceHistoryStore
+
+
+def test_compact_keeps_price_at(tmp_path):
+    path = str(tmp_path / "price_history.log")
+    store = PriceHistoryStore(path)
+    for timestamp, price in ((100, 10), (200, 12), (300, 11), (500, 9)):
+        store.record("us:B0C7SGVLP1", price, rating="4.5", timestamp=timestamp)
+    times = range(0, 700, 25)
+    expected = [store.price_at("us:B0C7SGVLP1", t) for t in times]
+
+    store.compact(before=400)
+    assert [store.price_at("us:B0C7SGVLP1", t) for t in times if t >= 300] == expected[12:]
+    store.close()
+
+    # The compacted log replays to the same answers
+    reopened = PriceHistoryStore(path)
+    assert [reopened.price_at("us:B0C7SGVLP1", t) for t in times if t >= 300] == expected[12:]
+    assert reopened.price_at("us:B0C7SGVLP1", 350).price == 11
+    reopened.close()
@@ -0,0 +1,48 @@
+from amazon_scraper.models import ProductData
+from amazon_scraper.pipeline import DataPipeline
+from amazon_scraper.sinks import read_manifest, read_rows
+from amazon_scraper.wal import WriteAheadLog
+
+
+def durable_pipeline(tmp_path):
+    csv_filename = str(tmp_path / "phone.csv")
+    pipeline = DataPipeline(
+        csv_filename=csv_filename,
+        storage_queue_limit=2,
+        rotate_rows=5,
+        wal=WriteAheadLog(f"{csv_filename}.wal", commit_window=0),
+    )
+    # Write batches on this thread, so the "crash" below happens between batches
+    pipeline.enqueue_batch = pipeline.save_batch
+    return pipeline
+
+
+def test_rotating_sink_survives_crash_and_restart(tmp_path):
+    crashed = durable_pipeline(tmp_path)
+    for number in range(12):
+        crashed.add_data(ProductData(name=f"B{number:09d}"))
+    # Crash: the open shard stays a .part file and never reaches the manifest
+    for sink in crashed.sinks.values():
+        sink.file.close()
+
+    restarted = durable_pipeline(tmp_path)
+    for number in range(12, 15):
+        restarted.add_data(ProductData(name=f"B{number:09d}"))
+    restarted.close_pipeline()
+
+    names = [row["name"] for row in read_rows(str(tmp_path / "phone.csv"))]
+    assert sorted(names) == [f"B{number:09d}" for number in range(15)]
+    shards = [shard["file"] for shard in read_manifest(str(tmp_path / "phone.csv"))["shards"]]
+    assert shards == [f"phone-{number:05d}.csv" for number in range(1, 5)]
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_torn_row_is_cut_from_leftover_shard(tmp_path):
+    (tmp_path / "phone-00001.csv.part").write_bytes(b"name,title\r\nB000000001,a\r\nB0000000")
+
+    pipeline = DataPipeline(csv_filename=str(tmp_path / "phone.csv"), rotate_rows=5)
+    pipeline.add_data(ProductData(name="B000000002"))
+    pipeline.close_pipeline()
+
+    names = [row["name"] for row in read_rows(str(tmp_path / "phone.csv"))]
+    assert names == ["B000000001", "B000000002"]